@@ -1,22 +1,102 @@
 from fastapi import FastAPI, Request, Form, HTTPException, Depends, status
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import asyncio
 import httpx
-import json
+import hashlib
+import logging
+import orjson
+import redis.asyncio as redis
+import secrets
+import time
 from typing import Optional
 import os
-from datetime import datetime, timedelta
+from cachetools import TTLCache
+from contextlib import asynccontextmanager
 
-app = FastAPI(title="PI-LMS Frontend", description="Frontend interface for PI-LMS")
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+# Configuration
+PAYLOAD_CMS_URL = os.getenv("PAYLOAD_CMS_URL", "http://localhost:3000")  # PayloadCMS backend URL
+SESSION_SECRET = "your-secret-key-here"  # In production, use environment variable
+PAYLOAD_MAX_CONN = int(os.getenv("PAYLOAD_MAX_CONN", "200"))  # Concurrent connections to PayloadCMS
+PAYLOAD_KEEPALIVE = int(os.getenv("PAYLOAD_KEEPALIVE", "100"))  # Idle connections kept open between bursts
+REDIS_URL = os.getenv("REDIS_URL")  # Shared session store; sessions stay in-process when unset
+SESSION_TTL = 86400  # 24 hours
+SESSION_SWEEP_INTERVAL = 300  # Seconds between purges of expired in-memory sessions
+RESPONSE_CACHE_TTL = 30  # Seconds a proxied course/lesson listing is reused
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))  # Browser cache lifetime for /static assets
+# PayloadCMS paths, relative to the shared client's base_url
+LOGIN_PATH = "/api/users/login"
+ME_PATH = "/api/users/me"
+COURSES_PATH = "/api/courses"
+COURSE_PATH = "/api/courses/%d"
+LESSONS_PATH = "/api/lessons"
+LESSON_PATH = "/api/lessons/%d"
+ENROLLMENTS_PATH = "/api/enrollments"
+
+EDITOR_ROLES = frozenset({"admin", "instructor"})  # Roles that may generate, edit and delete lessons
+ADMIN_ROLES = frozenset({"admin"})
+
+async def _sweep_sessions():
+    """Periodically drop expired in-memory sessions that are never looked up again"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        now = time.time()
+        for session_id in [sid for sid, session in sessions.items() if session["expires_at"] < now]:
+            sessions.pop(session_id, None)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared PayloadCMS client on startup and close it on shutdown"""
+    app.state.http = httpx.AsyncClient(
+        base_url=PAYLOAD_CMS_URL,
+        # Concurrent proxy calls share one connection when PayloadCMS is served over TLS with h2
+        http2=True,
+        # Fail fast when PayloadCMS is down or the pool is exhausted, but allow slow lesson payloads
+        timeout=httpx.Timeout(connect=2.0, read=10.0, write=10.0, pool=5.0),
+        limits=httpx.Limits(
+            max_connections=PAYLOAD_MAX_CONN,
+            max_keepalive_connections=PAYLOAD_KEEPALIVE,
+            keepalive_expiry=60.0
+        )
+    )
+    app.state.redis = redis.from_url(REDIS_URL) if REDIS_URL else None
+    # Redis expires sessions itself; in-memory ones need sweeping or abandoned cookies leak
+    sweeper = asyncio.create_task(_sweep_sessions()) if app.state.redis is None else None
+    try:
+        yield
+    finally:
+        if sweeper is not None:
+            sweeper.cancel()
+        await app.state.http.aclose()
+        if app.state.redis is not None:
+            await app.state.redis.aclose()
+
+app = FastAPI(
+    title="PI-LMS Frontend",
+    description="Frontend interface for PI-LMS",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
+class CachedStaticFiles(StaticFiles):
+    """Static files served with a Cache-Control header so browsers reuse them between pages"""
+    
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}"
+        return response
+
 # Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 # Templates
 templates = Jinja2Templates(directory="templates")
@@ -24,76 +104,103 @@ templates = Jinja2Templates(directory="templates")
 # Security
 security = HTTPBearer(auto_error=False)
 
-# Configuration
-PAYLOAD_CMS_URL = os.getenv("PAYLOAD_CMS_URL", "http://localhost:3000")  # PayloadCMS backend URL
-SESSION_SECRET = "your-secret-key-here"  # In production, use environment variable
-
-# In-memory session storage (in production, use Redis or database)
+# In-memory session storage, used when REDIS_URL is not configured
 sessions = {}
 
+# Short-lived cache of PayloadCMS /me lookups, keyed by token hash
+_user_cache = TTLCache(maxsize=10_000, ttl=60)
+
+def _token_key(token: str) -> str:
+    """Cache key for a token that avoids keeping raw JWTs as dict keys"""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+# Short-lived cache of proxied GET response bodies, used when REDIS_URL is not configured
+_response_cache = TTLCache(maxsize=1_000, ttl=RESPONSE_CACHE_TTL)
+
 class AuthService:
     """Authentication service for PayloadCMS integration"""
     
     @staticmethod
-    async def login(email: str, password: str) -> dict:
+    async def login(client: httpx.AsyncClient, email: str, password: str) -> dict:
         """Authenticate user with PayloadCMS"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{PAYLOAD_CMS_URL}/api/users/login",
-                    json={"email": email, "password": password},
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "success": True,
-                        "token": data.get("token"),
-                        "user": data.get("user"),
-                        "expires": data.get("exp")
-                    }
-                else:
-                    return {"success": False, "error": "Invalid credentials"}
-                    
-            except Exception as e:
-                return {"success": False, "error": f"Connection error: {str(e)}"}
+        try:
+            response = await client.post(
+                LOGIN_PATH,
+                json={"email": email, "password": password}
+            )
+            
+            if response.is_success:
+                data = response.json()
+                return {
+                    "success": True,
+                    "token": data.get("token"),
+                    "user": data.get("user"),
+                    "expires": data.get("exp")
+                }
+            else:
+                return {"success": False, "error": "Invalid credentials"}
+        
+        except Exception as e:
+            return {"success": False, "error": f"Connection error: {str(e)}"}
     
     @staticmethod
-    async def get_user_info(token: str) -> dict:
+    async def get_user_info(client: httpx.AsyncClient, token: str) -> dict:
         """Get current user information"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    f"{PAYLOAD_CMS_URL}/api/users/me",
-                    headers={"Authorization": f"JWT {token}"}
-                )
-                
-                if response.status_code == 200:
-                    return {"success": True, "user": response.json().get("user")}
-                else:
-                    return {"success": False, "error": "Invalid token"}
-                    
-            except Exception as e:
-                return {"success": False, "error": f"Connection error: {str(e)}"}
+        key = _token_key(token)
+        cached = _user_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await client.get(
+                ME_PATH,
+                headers={"Authorization": f"JWT {token}"}
+            )
+            
+            if response.is_success:
+                result = {"success": True, "user": response.json().get("user")}
+                _user_cache[key] = result
+                return result
+            else:
+                return {"success": False, "error": "Invalid token"}
+        
+        except Exception as e:
+            return {"success": False, "error": f"Connection error: {str(e)}"}
     
     @staticmethod
-    def create_session(user_data: dict, token: str) -> str:
+    async def create_session(store: Optional[redis.Redis], user_data: dict, token: str) -> str:
         """Create a new session"""
-        session_id = f"session_{datetime.now().timestamp()}"
+        session_id = secrets.token_urlsafe(32)
+        # Built once here so proxy calls can pass it straight to PayloadCMS
+        auth_headers = {"Authorization": f"JWT {token}"}
+        if store is not None:
+            # Redis expires the key itself, so no expiry bookkeeping is needed
+            await store.set(
+                f"sess:{session_id}",
+                orjson.dumps({"user": user_data, "token": token, "auth_headers": auth_headers}),
+                ex=SESSION_TTL
+            )
+            return session_id
+        
+        now = time.time()
         sessions[session_id] = {
             "user": user_data,
             "token": token,
-            "created_at": datetime.now(),
-            "expires_at": datetime.now() + timedelta(hours=24)
+            "auth_headers": auth_headers,
+            "created_at": now,
+            "expires_at": now + SESSION_TTL
         }
         return session_id
     
     @staticmethod
-    def get_session(session_id: str) -> Optional[dict]:
+    async def get_session(store: Optional[redis.Redis], session_id: str) -> Optional[dict]:
         """Get session data"""
+        if store is not None:
+            data = await store.get(f"sess:{session_id}")
+            return orjson.loads(data) if data else None
+        
         session = sessions.get(session_id)
-        if session and session["expires_at"] > datetime.now():
+        if session and session["expires_at"] > time.time():
             return session
         elif session:
             # Remove expired session
@@ -101,30 +208,143 @@ class AuthService:
         return None
     
     @staticmethod
-    def delete_session(session_id: str):
+    def invalidate_user_info(token: str):
+        """Drop the cached user info for a token"""
+        _user_cache.pop(_token_key(token), None)
+    
+    @staticmethod
+    async def delete_session(store: Optional[redis.Redis], session_id: str):
         """Delete session"""
-        if session_id in sessions:
+        if store is not None:
+            await store.delete(f"sess:{session_id}")
+        elif session_id in sessions:
             del sessions[session_id]
 
-def get_current_session(request: Request) -> Optional[dict]:
-    """Get current user session from cookies"""
+async def current_session_optional(request: Request) -> Optional[dict]:
+    """Get current user session from cookies, or None
+    
+    FastAPI caches dependency results per request, so every dependency built on
+    this one shares a single cookie and session lookup.
+    """
     session_id = request.cookies.get("session_id")
     if session_id:
-        return AuthService.get_session(session_id)
+        return await AuthService.get_session(request.app.state.redis, session_id)
     return None
 
+async def current_session(session: Optional[dict] = Depends(current_session_optional)) -> dict:
+    """Get current user session, or answer 401"""
+    if not session:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return session
+
+class LoginRequired(Exception):
+    """Raised by page dependencies when there is no session"""
+
+@app.exception_handler(LoginRequired)
+async def login_required_handler(request: Request, exc: LoginRequired):
+    """Send browsers without a session to the login page"""
+    return RedirectResponse(url="/login", status_code=302)
+
+@app.exception_handler(httpx.HTTPStatusError)
+async def payload_status_handler(request: Request, exc: httpx.HTTPStatusError):
+    """PayloadCMS answered with an error status, which is passed on with its message"""
+    response = exc.response
+    logger.warning(
+        "PayloadCMS returned %s for %s %s: %s",
+        response.status_code, request.method, request.url.path, response.text
+    )
+    try:
+        error_data = orjson.loads(response.content)
+    except ValueError:
+        error_data = None
+    message = None
+    if isinstance(error_data, dict):
+        # PayloadCMS reports {"errors": [{"message": ...}]}; custom endpoints use {"message": ...}
+        errors = error_data.get("errors")
+        message = errors[0].get("message") if errors else error_data.get("message")
+    return ORJSONResponse(
+        {"error": message or f"PayloadCMS returned {response.status_code} {response.reason_phrase}"},
+        status_code=response.status_code
+    )
+
+@app.exception_handler(httpx.HTTPError)
+async def payload_error_handler(request: Request, exc: httpx.HTTPError):
+    """PayloadCMS could not be reached or answered with an error"""
+    logger.exception("PayloadCMS request failed for %s %s", request.method, request.url.path)
+    return ORJSONResponse({"error": f"Connection error: {exc}"}, status_code=502)
+
+@app.exception_handler(Exception)
+async def unhandled_error_handler(request: Request, exc: Exception):
+    """Last-resort handler so failures are logged once and answered in the usual error shape"""
+    logger.exception("Unhandled error for %s %s", request.method, request.url.path)
+    return ORJSONResponse({"error": "Internal server error"}, status_code=500)
+
+def require_roles(*roles: str, login_redirect: bool = False):
+    """Dependency returning the session, optionally restricted to the given roles
+    
+    Pages pass login_redirect=True to send anonymous users to /login instead of a 401.
+    """
+    allowed = frozenset(roles)
+    denied_detail = f"Access denied. {' or '.join(sorted(role.title() for role in allowed))} role required."
+    
+    async def dependency(session: Optional[dict] = Depends(current_session_optional)) -> dict:
+        if not session:
+            if login_redirect:
+                raise LoginRequired()
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        if allowed and session["user"].get("role") not in allowed:
+            raise HTTPException(status_code=403, detail=denied_detail)
+        return session
+    
+    return dependency
+
+def _response_cache_key(request: Request, session: dict) -> str:
+    """Cache key for a read endpoint, scoped to the user since results depend on role"""
+    user = session["user"]
+    return f"resp:{request.url.path}:{user.get('id')}:{user.get('role')}"
+
+async def get_cached_response(store: Optional[redis.Redis], key: str) -> Optional[bytes]:
+    """Get a cached response body"""
+    if store is not None:
+        return await store.get(key)
+    return _response_cache.get(key)
+
+async def clear_cached_responses(store: Optional[redis.Redis]):
+    """Drop every cached response body after a write"""
+    if store is not None:
+        keys = [key async for key in store.scan_iter("resp:*")]
+        if keys:
+            await store.delete(*keys)
+    else:
+        _response_cache.clear()
+
+def etag_response(request: Request, body: bytes) -> Response:
+    """Return a JSON body with an ETag, or an empty 304 if the client already has it"""
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+async def cache_response(request: Request, key: str, body: bytes) -> Response:
+    """Cache an encoded read endpoint result, then return it with an ETag"""
+    store = request.app.state.redis
+    if store is not None:
+        await store.set(key, body, ex=RESPONSE_CACHE_TTL)
+    else:
+        _response_cache[key] = body
+    return etag_response(request, body)
+
 @app.get("/", response_class=HTMLResponse)
-async def root(request: Request):
+async def root(session: Optional[dict] = Depends(current_session_optional)):
     """Root endpoint - redirect to login or dashboard based on auth status"""
-    session = get_current_session(request)
     if session:
         return RedirectResponse(url="/dashboard", status_code=302)
     return RedirectResponse(url="/login", status_code=302)
 
 @app.get("/login", response_class=HTMLResponse)
-async def login_page(request: Request):
+async def login_page(request: Request, session: Optional[dict] = Depends(current_session_optional)):
     """Login page"""
-    session = get_current_session(request)
     if session:
         return RedirectResponse(url="/dashboard", status_code=302)
     return templates.TemplateResponse("login.html", {"request": request})
@@ -132,445 +352,287 @@ async def login_page(request: Request):
 @app.post("/api/login")
 async def api_login(request: Request, email: str = Form(...), password: str = Form(...)):
     """API endpoint for login"""
-    auth_result = await AuthService.login(email, password)
+    auth_result = await AuthService.login(request.app.state.http, email, password)
     
     if auth_result["success"]:
-        session_id = AuthService.create_session(auth_result["user"], auth_result["token"])
-        response = JSONResponse({"success": True, "redirect": "/dashboard"})
+        session_id = await AuthService.create_session(request.app.state.redis, auth_result["user"], auth_result["token"])
+        response = ORJSONResponse({"success": True, "redirect": "/dashboard"})
         response.set_cookie(
             key="session_id", 
             value=session_id, 
             httponly=True, 
-            max_age=86400,  # 24 hours
+            max_age=SESSION_TTL,
             samesite="lax"
         )
         return response
     else:
-        return JSONResponse(
+        return ORJSONResponse(
             {"success": False, "error": auth_result["error"]}, 
             status_code=400
         )
 
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request):
+async def dashboard(request: Request, session: dict = Depends(require_roles(login_redirect=True))):
     """Dashboard page"""
-    session = get_current_session(request)
-    if not session:
-        return RedirectResponse(url="/login", status_code=302)
-    
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
         "user": session["user"]
     })
 
 @app.get("/lesson-generator", response_class=HTMLResponse)
-async def lesson_generator(request: Request):
+async def lesson_generator(request: Request, session: dict = Depends(require_roles(*EDITOR_ROLES, login_redirect=True))):
     """AI Lesson Generator page - Admin and Instructor only"""
-    session = get_current_session(request)
-    if not session:
-        return RedirectResponse(url="/login", status_code=302)
-    
-    # Check if user has permission to access lesson generator
-    user_role = session["user"].get("role")
-    if user_role not in ["admin", "instructor"]:
-        raise HTTPException(status_code=403, detail="Access denied. Admin or Instructor role required.")
-    
     return templates.TemplateResponse("lesson_generator.html", {
         "request": request,
         "user": session["user"]
     })
 
 @app.post("/api/logout")
-async def api_logout(request: Request):
+async def api_logout(request: Request, session: Optional[dict] = Depends(current_session_optional)):
     """API endpoint for logout"""
     session_id = request.cookies.get("session_id")
     if session_id:
-        AuthService.delete_session(session_id)
+        if session:
+            AuthService.invalidate_user_info(session["token"])
+        await AuthService.delete_session(request.app.state.redis, session_id)
     
-    response = JSONResponse({"success": True, "redirect": "/login"})
+    response = ORJSONResponse({"success": True, "redirect": "/login"})
     response.delete_cookie("session_id")
     return response
 
 @app.get("/api/me")
-async def api_me(request: Request):
+async def api_me(request: Request, session: dict = Depends(current_session)):
     """Get current user info - for pi-ai integration"""
-    session = get_current_session(request)
-    if not session:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
     return {"user": session["user"], "token": session["token"]}
 
 @app.get("/api/token")
-async def api_get_token(request: Request):
+async def api_get_token(request: Request, session: dict = Depends(current_session)):
     """Get auth token - for pi-ai integration"""
-    session = get_current_session(request)
-    if not session:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
     return {"token": session["token"]}
 
 @app.get("/courses", response_class=HTMLResponse)
-async def courses_page(request: Request):
+async def courses_page(request: Request, session: dict = Depends(require_roles(login_redirect=True))):
     """Courses listing page"""
-    session = get_current_session(request)
-    if not session:
-        return RedirectResponse(url="/login", status_code=302)
-    
     return templates.TemplateResponse("courses.html", {
         "request": request,
         "user": session["user"]
     })
 
 @app.get("/courses/{course_id}", response_class=HTMLResponse)
-async def course_detail_page(request: Request, course_id: int):
+async def course_detail_page(request: Request, course_id: int, session: dict = Depends(require_roles(login_redirect=True))):
     """Course detail page showing lessons"""
-    session = get_current_session(request)
-    if not session:
-        return RedirectResponse(url="/login", status_code=302)
+    client = request.app.state.http
+    response = await client.get(
+        COURSE_PATH % course_id,
+        headers=session["auth_headers"]
+    )
+    response.raise_for_status()
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{PAYLOAD_CMS_URL}/api/courses/{course_id}",
-                headers={"Authorization": f"JWT {session['token']}"}
-            )
-            
-            if response.status_code == 200:
-                course_data = response.json()
-                return templates.TemplateResponse("course_detail.html", {
-                    "request": request,
-                    "user": session["user"],
-                    "course": course_data
-                })
-            else:
-                raise HTTPException(status_code=404, detail="Course not found")
-                
-    except Exception as e:
-        print(f"Error fetching course: {e}")
-        raise HTTPException(status_code=500, detail="Failed to load course")
+    return templates.TemplateResponse("course_detail.html", {
+        "request": request,
+        "user": session["user"],
+        "course": response.json()
+    })
 
 @app.get("/lessons/{lesson_id}", response_class=HTMLResponse)
-async def lesson_view_page(request: Request, lesson_id: int):
+async def lesson_view_page(request: Request, lesson_id: int, session: dict = Depends(require_roles(login_redirect=True))):
     """Lesson view page"""
-    session = get_current_session(request)
-    if not session:
-        return RedirectResponse(url="/login", status_code=302)
+    client = request.app.state.http
+    response = await client.get(
+        LESSON_PATH % lesson_id,
+        headers=session["auth_headers"]
+    )
+    response.raise_for_status()
+    lesson_data = response.json()
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{PAYLOAD_CMS_URL}/api/lessons/{lesson_id}",
-                headers={"Authorization": f"JWT {session['token']}"}
-            )
-            
-            if response.status_code == 200:
-                lesson_data = response.json()
-                
-                # Check if student is trying to access unpublished lesson
-                user_role = session["user"].get("role")
-                if user_role == "student" and not lesson_data.get("published", False):
-                    raise HTTPException(status_code=404, detail="Lesson not found")
-                
-                return templates.TemplateResponse("lesson_view.html", {
-                    "request": request,
-                    "user": session["user"],
-                    "lesson": lesson_data
-                })
-            else:
-                raise HTTPException(status_code=404, detail="Lesson not found")
-                
-    except Exception as e:
-        print(f"Error fetching lesson: {e}")
-        raise HTTPException(status_code=500, detail="Failed to load lesson")
+    # Check if student is trying to access unpublished lesson
+    user_role = session["user"].get("role")
+    if user_role == "student" and not lesson_data.get("published", False):
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    
+    return templates.TemplateResponse("lesson_view.html", {
+        "request": request,
+        "user": session["user"],
+        "lesson": lesson_data
+    })
 
 @app.get("/lessons/{lesson_id}/edit", response_class=HTMLResponse)
-async def lesson_edit_page(request: Request, lesson_id: int):
+async def lesson_edit_page(request: Request, lesson_id: int, session: dict = Depends(require_roles(*EDITOR_ROLES, login_redirect=True))):
     """Lesson edit page - Admin and Instructor only"""
-    session = get_current_session(request)
-    if not session:
-        return RedirectResponse(url="/login", status_code=302)
-    
-    # Check if user has permission to edit lessons
-    user_role = session["user"].get("role")
-    if user_role not in ["admin", "instructor"]:
-        raise HTTPException(status_code=403, detail="Access denied. Admin or Instructor role required.")
+    client = request.app.state.http
+    response = await client.get(
+        LESSON_PATH % lesson_id,
+        headers=session["auth_headers"]
+    )
+    response.raise_for_status()
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{PAYLOAD_CMS_URL}/api/lessons/{lesson_id}",
-                headers={"Authorization": f"JWT {session['token']}"}
-            )
-            
-            if response.status_code == 200:
-                lesson_data = response.json()
-                return templates.TemplateResponse("lesson_edit.html", {
-                    "request": request,
-                    "user": session["user"],
-                    "lesson": lesson_data
-                })
-            else:
-                raise HTTPException(status_code=404, detail="Lesson not found")
-                
-    except Exception as e:
-        print(f"Error fetching lesson: {e}")
-        raise HTTPException(status_code=500, detail="Failed to load lesson")
+    return templates.TemplateResponse("lesson_edit.html", {
+        "request": request,
+        "user": session["user"],
+        "lesson": response.json()
+    })
 
 @app.get("/api/courses")
-async def api_get_courses(request: Request):
+async def api_get_courses(request: Request, session: dict = Depends(current_session)):
     """Get available courses from PayloadCMS"""
-    session = get_current_session(request)
-    if not session:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    cache_key = _response_cache_key(request, session)
+    cached = await get_cached_response(request.app.state.redis, cache_key)
+    if cached is not None:
+        return etag_response(request, cached)
     
-    try:
-        user_role = session["user"].get("role")
-        user_id = session["user"].get("id")
+    user_role = session["user"].get("role")
+    user_id = session["user"].get("id")
+    
+    client = request.app.state.http
+    # For students, get only enrolled courses
+    if user_role == "student":
+        # Enrollments populate their course at depth 2, so one query returns the course docs
+        enrollments_response = await client.get(
+            ENROLLMENTS_PATH,
+            params={"where[user][equals]": user_id, "depth": 2, "limit": 200},
+            headers=session["auth_headers"]
+        )
+        enrollments_response.raise_for_status()
         
-        async with httpx.AsyncClient() as client:
-            # For students, get only enrolled courses
-            if user_role == "student":
-                # First get enrollments for this student
-                enrollments_response = await client.get(
-                    f"{PAYLOAD_CMS_URL}/api/enrollments?where[user][equals]={user_id}",
-                    headers={"Authorization": f"JWT {session['token']}"}
-                )
-                
-                if enrollments_response.status_code == 200:
-                    enrollments_data = enrollments_response.json()
-                    course_ids = [enrollment["course"]["id"] for enrollment in enrollments_data.get("docs", []) if enrollment.get("course")]
-                    
-                    if course_ids:
-                        # Get courses by IDs
-                        courses_query = "&".join([f"where[id][in][]={course_id}" for course_id in course_ids])
-                        response = await client.get(
-                            f"{PAYLOAD_CMS_URL}/api/courses?{courses_query}",
-                            headers={"Authorization": f"JWT {session['token']}"}
-                        )
-                    else:
-                        return {"courses": []}
-                else:
-                    return {"courses": [], "error": "Failed to fetch enrollments"}
-            
-            # For teachers, get only assigned courses
-            elif user_role == "instructor":
-                response = await client.get(
-                    f"{PAYLOAD_CMS_URL}/api/courses?where[instructor][equals]={user_id}",
-                    headers={"Authorization": f"JWT {session['token']}"}
-                )
-            
-            # For admins, get all courses
-            else:
-                response = await client.get(
-                    f"{PAYLOAD_CMS_URL}/api/courses",
-                    headers={"Authorization": f"JWT {session['token']}"}
-                )
-            
-            if response.status_code == 200:
-                courses_data = response.json()
-                return {"courses": courses_data.get("docs", [])}
-            else:
-                return {"courses": [], "error": "Failed to fetch courses"}
-                
-    except Exception as e:
-        print(f"Error fetching courses: {e}")
-        return {"courses": [], "error": f"Connection error: {str(e)}"}
+        enrollments_data = orjson.loads(enrollments_response.content)
+        courses = [enrollment["course"] for enrollment in enrollments_data.get("docs", []) if enrollment.get("course")]
+        return await cache_response(request, cache_key, orjson.dumps({"courses": courses}))
+    
+    # For teachers, get only assigned courses
+    elif user_role == "instructor":
+        response = await client.get(
+            COURSES_PATH,
+            params={"where[instructor][equals]": user_id},
+            headers=session["auth_headers"]
+        )
+    
+    # For admins, get all courses
+    else:
+        response = await client.get(
+            COURSES_PATH,
+            headers=session["auth_headers"]
+        )
+    response.raise_for_status()
+    
+    courses_data = orjson.loads(response.content)
+    return await cache_response(request, cache_key, orjson.dumps({"courses": courses_data.get("docs", [])}))
 
 @app.get("/api/courses/{course_id}/lessons")
-async def api_get_course_lessons(request: Request, course_id: int):
+async def api_get_course_lessons(request: Request, course_id: int, session: dict = Depends(current_session)):
     """Get lessons for a specific course"""
-    session = get_current_session(request)
-    if not session:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    cache_key = _response_cache_key(request, session)
+    cached = await get_cached_response(request.app.state.redis, cache_key)
+    if cached is not None:
+        return etag_response(request, cached)
     
-    try:
-        user_role = session["user"].get("role")
-        
-        async with httpx.AsyncClient() as client:
-            # For students, only show published lessons
-            if user_role == "student":
-                response = await client.get(
-                    f"{PAYLOAD_CMS_URL}/api/lessons?where[course][equals]={course_id}&where[published][equals]=true&sort=createdAt",
-                    headers={"Authorization": f"JWT {session['token']}"}
-                )
-            else:
-                # For instructors and admins, show all lessons
-                response = await client.get(
-                    f"{PAYLOAD_CMS_URL}/api/lessons?where[course][equals]={course_id}&sort=createdAt",
-                    headers={"Authorization": f"JWT {session['token']}"}
-                )
-            
-            if response.status_code == 200:
-                lessons_data = response.json()
-                return {"lessons": lessons_data.get("docs", [])}
-            else:
-                return {"lessons": [], "error": "Failed to fetch lessons"}
-                
-    except Exception as e:
-        print(f"Error fetching lessons: {e}")
-        return {"lessons": [], "error": f"Connection error: {str(e)}"}
+    user_role = session["user"].get("role")
+    
+    client = request.app.state.http
+    # For students, only show published lessons
+    if user_role == "student":
+        response = await client.get(
+            LESSONS_PATH,
+            params={"where[course][equals]": course_id, "where[published][equals]": "true", "sort": "createdAt"},
+            headers=session["auth_headers"]
+        )
+    else:
+        # For instructors and admins, show all lessons
+        response = await client.get(
+            LESSONS_PATH,
+            params={"where[course][equals]": course_id, "sort": "createdAt"},
+            headers=session["auth_headers"]
+        )
+    response.raise_for_status()
+    
+    lessons_data = orjson.loads(response.content)
+    return await cache_response(request, cache_key, orjson.dumps({"lessons": lessons_data.get("docs", [])}))
 
 @app.get("/api/lessons/{lesson_id}")
-async def api_get_lesson(request: Request, lesson_id: int):
+async def api_get_lesson(request: Request, lesson_id: int, session: dict = Depends(current_session)):
     """Get a specific lesson"""
-    session = get_current_session(request)
-    if not session:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    cache_key = _response_cache_key(request, session)
+    cached = await get_cached_response(request.app.state.redis, cache_key)
+    if cached is not None:
+        return etag_response(request, cached)
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{PAYLOAD_CMS_URL}/api/lessons/{lesson_id}",
-                headers={"Authorization": f"JWT {session['token']}"}
-            )
-            
-            if response.status_code == 200:
-                lesson_data = response.json()
-                
-                # Check if student is trying to access unpublished lesson
-                user_role = session["user"].get("role")
-                if user_role == "student" and not lesson_data.get("published", False):
-                    raise HTTPException(status_code=404, detail="Lesson not found")
-                
-                return {"lesson": lesson_data}
-            else:
-                raise HTTPException(status_code=404, detail="Lesson not found")
-                
-    except Exception as e:
-        print(f"Error fetching lesson: {e}")
-        raise HTTPException(status_code=500, detail="Failed to fetch lesson")
-
-@app.put("/api/lessons/{lesson_id}")
-async def api_update_lesson(request: Request, lesson_id: int):
-    """Update a lesson - Admin and Instructor only"""
-    session = get_current_session(request)
-    if not session:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    client = request.app.state.http
+    response = await client.get(
+        LESSON_PATH % lesson_id,
+        headers=session["auth_headers"]
+    )
+    response.raise_for_status()
     
-    # Check if user has permission to edit lessons
+    # Check if student is trying to access unpublished lesson
     user_role = session["user"].get("role")
-    if user_role not in ["admin", "instructor"]:
-        raise HTTPException(status_code=403, detail="Access denied. Admin or Instructor role required.")
+    if user_role == "student" and not orjson.loads(response.content).get("published", False):
+        raise HTTPException(status_code=404, detail="Lesson not found")
     
+    # Wrap PayloadCMS's bytes as-is rather than decoding and re-encoding the lesson tree
+    return await cache_response(request, cache_key, b'{"lesson":' + response.content + b'}')
+
+@app.put("/api/lessons/{lesson_id}")
+async def api_update_lesson(request: Request, lesson_id: int, session: dict = Depends(require_roles(*EDITOR_ROLES))):
+    """Update a lesson - Admin and Instructor only"""
     try:
-        lesson_data = await request.json()
-        
-        # Comprehensive server-side logging
-        print("=== BACKEND LESSON UPDATE DEBUG ===")
-        print(f"Lesson ID: {lesson_id}")
-        print(f"User: {session['user'].get('email')} ({user_role})")
-        print(f"Data received from frontend:")
-        print(json.dumps(lesson_data, indent=2))
-        
-        # Check content structure if present
-        if 'content' in lesson_data and lesson_data['content']:
-            content = lesson_data['content']
-            print(f"Content structure analysis:")
-            print(f"- Has root: {'root' in content}")
-            if 'root' in content:
-                print(f"- Root type: {content['root'].get('type', 'MISSING')}")
-                print(f"- Root children count: {len(content['root'].get('children', []))}")
-                print(f"- Root children types: {[child.get('type', 'UNKNOWN') for child in content['root'].get('children', [])]}")
-        print("=== END BACKEND DEBUG ===")
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.patch(
-                f"{PAYLOAD_CMS_URL}/api/lessons/{lesson_id}",
-                json=lesson_data,
-                headers={"Authorization": f"JWT {session['token']}"}
+        lesson_data = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    
+    # Payload diagnostics are only built when debug logging is enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Lesson %s update by %s (%s): %s",
+            lesson_id, session["user"].get("email"), session["user"].get("role"),
+            orjson.dumps(lesson_data, option=orjson.OPT_INDENT_2).decode()
+        )
+        content = lesson_data.get("content")
+        if content and "root" in content:
+            children = content["root"].get("children", [])
+            logger.debug(
+                "Lesson %s content root type=%s children=%d types=%s",
+                lesson_id, content["root"].get("type", "MISSING"), len(children),
+                [child.get("type", "UNKNOWN") for child in children]
             )
-            
-            print(f"PayloadCMS response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                updated_lesson = response.json()
-                print("PayloadCMS update successful!")
-                return {"lesson": updated_lesson}
-            else:
-                error_text = response.text
-                print(f"PayloadCMS error response: {error_text}")
-                
-                try:
-                    error_data = response.json()
-                    print(f"Parsed PayloadCMS error: {json.dumps(error_data, indent=2)}")
-                except:
-                    error_data = {"message": error_text}
-                
-                return JSONResponse(
-                    {"error": error_data.get("message", "Failed to update lesson")},
-                    status_code=response.status_code
-                )
-                
-    except Exception as e:
-        print(f"Error updating lesson: {e}")
-        import traceback
-        traceback.print_exc()
-        return JSONResponse({"error": f"Connection error: {str(e)}"}, status_code=500)
+    
+    client = request.app.state.http
+    response = await client.patch(
+        LESSON_PATH % lesson_id,
+        json=lesson_data,
+        headers=session["auth_headers"]
+    )
+    
+    logger.debug("PayloadCMS response status for lesson %s: %s", lesson_id, response.status_code)
+    response.raise_for_status()
+    
+    await clear_cached_responses(request.app.state.redis)
+    return {"lesson": response.json()}
 
 @app.delete("/api/lessons/{lesson_id}")
-async def api_delete_lesson(request: Request, lesson_id: int):
+async def api_delete_lesson(request: Request, lesson_id: int, session: dict = Depends(require_roles(*EDITOR_ROLES))):
     """Delete a lesson - Admin and Instructor only"""
-    session = get_current_session(request)
-    if not session:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    # Check if user has permission to delete lessons
-    user_role = session["user"].get("role")
-    if user_role not in ["admin", "instructor"]:
-        raise HTTPException(status_code=403, detail="Access denied. Admin or Instructor role required.")
+    client = request.app.state.http
+    response = await client.delete(
+        LESSON_PATH % lesson_id,
+        headers=session["auth_headers"]
+    )
+    response.raise_for_status()
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.delete(
-                f"{PAYLOAD_CMS_URL}/api/lessons/{lesson_id}",
-                headers={"Authorization": f"JWT {session['token']}"}
-            )
-            
-            if response.status_code == 200:
-                return {"success": True, "message": "Lesson deleted successfully"}
-            else:
-                error_data = response.json() if response.headers.get("content-type") == "application/json" else {}
-                return JSONResponse(
-                    {"error": error_data.get("message", "Failed to delete lesson")},
-                    status_code=response.status_code
-                )
-                
-    except Exception as e:
-        print(f"Error deleting lesson: {e}")
-        return JSONResponse({"error": f"Connection error: {str(e)}"}, status_code=500)
+    await clear_cached_responses(request.app.state.redis)
+    return {"success": True, "message": "Lesson deleted successfully"}
 
 @app.delete("/api/courses/{course_id}")
-async def api_delete_course(request: Request, course_id: int):
+async def api_delete_course(request: Request, course_id: int, session: dict = Depends(require_roles(*ADMIN_ROLES))):
     """Delete a course - Admin only"""
-    session = get_current_session(request)
-    if not session:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    # Check if user has permission to delete courses
-    user_role = session["user"].get("role")
-    if user_role != "admin":
-        raise HTTPException(status_code=403, detail="Access denied. Admin role required.")
+    client = request.app.state.http
+    response = await client.delete(
+        COURSE_PATH % course_id,
+        headers=session["auth_headers"]
+    )
+    response.raise_for_status()
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.delete(
-                f"{PAYLOAD_CMS_URL}/api/courses/{course_id}",
-                headers={"Authorization": f"JWT {session['token']}"}
-            )
-            
-            if response.status_code == 200:
-                return {"success": True, "message": "Course deleted successfully"}
-            else:
-                error_data = response.json() if response.headers.get("content-type") == "application/json" else {}
-                return JSONResponse(
-                    {"error": error_data.get("message", "Failed to delete course")},
-                    status_code=response.status_code
-                )
-                
-    except Exception as e:
-        print(f"Error deleting course: {e}")
-        return JSONResponse({"error": f"Connection error: {str(e)}"}, status_code=500)
+    await clear_cached_responses(request.app.state.redis)
+    return {"success": True, "message": "Course deleted successfully"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    uvicorn.run(app, host="0.0.0.0", port=8080, loop="uvloop", http="httptools")
@@ -7,7 +7,9 @@ the frontend application and pi-ai.
 
 from .auth_service import (
     PIAuthService,
+    create_payload_client,
     get_auth_service,
+    configure_auth_service,
     get_auth_token,
     authenticate,
     get_current_user,
@@ -17,7 +19,9 @@ from .auth_service import (
 
 __all__ = [
     'PIAuthService',
+    'create_payload_client',
     'get_auth_service',
+    'configure_auth_service',
     'get_auth_token',
     'authenticate',
     'get_current_user',
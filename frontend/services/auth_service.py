@@ -4,107 +4,212 @@ This module provides authentication functionality that can be used by both
 the frontend application and the pi-ai service to manage PayloadCMS auth tokens.
 """
 
+import asyncio
 import httpx
 import json
 import os
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
+from functools import lru_cache
+from importlib.util import find_spec
 from typing import Optional, Dict, Any
 from pathlib import Path
 
+# orjson comes with the frontend's requirements; pi-ai imports this module without them
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(data: Any) -> bytes:
+        return json.dumps(data, separators=(",", ":")).encode()
+    _loads = json.loads
+
+# PayloadCMS paths, relative to the client's base_url
+_LOGIN_PATH = "/api/users/login"
+_ME_PATH = "/api/users/me"
+_REFRESH_PATH = "/api/users/refresh-token"
+
+TOKEN_LIFETIME = 86400  # Assumed lifetime when PayloadCMS does not report an expiry
+TOKEN_EXPIRY_BUFFER = 300  # Treat tokens as expired 5 minutes early
+TOKEN_REFRESH_AHEAD = 600  # Refresh in the background 10 minutes before expiry
+VERIFY_TTL = 30  # Seconds a successful /me check is trusted by is_authenticated
+
+def create_payload_client(payload_url: str) -> httpx.AsyncClient:
+    """Create a pooled PayloadCMS client suited to many small concurrent auth calls"""
+    return httpx.AsyncClient(
+        base_url=payload_url,
+        # h2 ships with the frontend's httpx[http2]; pi-ai may import this module without it
+        http2=find_spec("h2") is not None,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=60.0),
+        timeout=httpx.Timeout(10.0, connect=2.0)
+    )
+
 class PIAuthService:
     """Shared authentication service for PI-LMS ecosystem"""
     
-    def __init__(self, payload_url: str = "http://localhost:3000"):
+    def __init__(self, payload_url: str = "http://localhost:3000", client: Optional[httpx.AsyncClient] = None):
         self.payload_url = payload_url
         self.token_file = Path("auth_token.json")
         self._current_token = None
-        self._token_expires_at = None
-        
+        self._auth_headers: Optional[Dict[str, str]] = None
+        self._token_expires_at_ts: Optional[float] = None
+        # Last token record saved or loaded; the file is only read when this is empty
+        self._cached_token_data: Optional[Dict[str, Any]] = None
+        # Monotonic deadlines, so hot checks are a float compare rather than datetime math
+        self._valid_until = 0.0
+        self._verified_until = 0.0
+        self._refresh_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+        # A client passed in is shared with its creator, who is responsible for closing it
+        self._client = client
+        self._owns_client = client is None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the PayloadCMS client, created on first use and kept for connection reuse"""
+        if self._client is None:
+            self._client = create_payload_client(self.payload_url)
+        return self._client
+    
+    async def aclose(self) -> None:
+        """Close the PayloadCMS client if this service created it"""
+        self._stop_refresh()
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
+            self._client = None
+    
+    async def __aenter__(self) -> "PIAuthService":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
+    def _set_token(self, token: str, expires_at_ts: float) -> None:
+        """Remember the current token and when it stops being usable"""
+        self._current_token = token
+        self._auth_headers = {"Authorization": f"JWT {token}"}
+        self._token_expires_at_ts = expires_at_ts
+        now = time.monotonic()
+        seconds_left = expires_at_ts - time.time()
+        self._valid_until = now + seconds_left - TOKEN_EXPIRY_BUFFER
+        self._refresh_at = now + seconds_left - TOKEN_REFRESH_AHEAD
+        self._verified_until = 0.0
+    
+    def _start_refresh(self) -> None:
+        """Keep the current token fresh in the background, so no caller waits on a refresh"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+    
+    def _stop_refresh(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+    
+    async def _refresh_loop(self) -> None:
+        """Refresh the token shortly before it expires for as long as one is held"""
+        while self._current_token:
+            await asyncio.sleep(max(0.0, self._refresh_at - time.monotonic()))
+            if not self._current_token:
+                break
+            result = await self.refresh_token()
+            if not result["success"]:
+                # Leave it to callers, who will log in again once the token lapses
+                break
+    
     def _save_token(self, token_data: Dict[str, Any]) -> None:
         """Save token data to file for persistence"""
         try:
-            with open(self.token_file, 'w') as f:
-                json.dump(token_data, f)
+            # Serialize first so the file is written in one call
+            self.token_file.write_bytes(_dumps(token_data))
         except Exception as e:
             print(f"Warning: Could not save token to file: {e}")
     
     def _load_token(self) -> Optional[Dict[str, Any]]:
         """Load token data from file"""
         try:
-            if self.token_file.exists():
-                with open(self.token_file, 'r') as f:
-                    return json.load(f)
+            self._cached_token_data = _loads(self.token_file.read_bytes())
+            return self._cached_token_data
+        except FileNotFoundError:
+            pass
         except Exception as e:
             print(f"Warning: Could not load token from file: {e}")
         return None
     
+    @staticmethod
+    def _token_expiry(token_data: Dict[str, Any]) -> float:
+        """Expiry of a stored token record as an epoch timestamp"""
+        expires_at_ts = token_data.get("expires_at_ts")
+        if expires_at_ts is None:
+            # Records saved before expires_at_ts existed only carry the ISO string
+            expires_at_ts = datetime.fromisoformat(token_data["expires_at"]).timestamp()
+        return expires_at_ts
+    
     def _is_token_valid(self, token_data: Dict[str, Any]) -> bool:
         """Check if stored token is still valid"""
-        if not token_data or 'expires_at' not in token_data:
+        if not token_data or ('expires_at_ts' not in token_data and 'expires_at' not in token_data):
             return False
         
-        expires_at = datetime.fromisoformat(token_data['expires_at'])
-        return datetime.now() < expires_at - timedelta(minutes=5)  # 5 min buffer
+        return time.time() < self._token_expiry(token_data) - TOKEN_EXPIRY_BUFFER
     
     async def login(self, email: str, password: str) -> Dict[str, Any]:
         """Authenticate with PayloadCMS and store token"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.payload_url}/api/users/login",
-                    json={"email": email, "password": password},
-                    headers={"Content-Type": "application/json"}
-                )
+        client = self._get_client()
+        try:
+            response = await client.post(
+                _LOGIN_PATH,
+                json={"email": email, "password": password}
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                token = data.get("token")
+                user = data.get("user")
+                exp = data.get("exp")
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    token = data.get("token")
-                    user = data.get("user")
-                    exp = data.get("exp")
+                if token:
+                    # Calculate expiration time
+                    expires_at_ts = exp or time.time() + TOKEN_LIFETIME
+                    expires_at = datetime.fromtimestamp(expires_at_ts).isoformat()
                     
-                    if token:
-                        # Calculate expiration time
-                        expires_at = datetime.now() + timedelta(hours=24)
-                        if exp:
-                            expires_at = datetime.fromtimestamp(exp)
-                        
-                        token_data = {
-                            "token": token,
-                            "user": user,
-                            "expires_at": expires_at.isoformat()
-                        }
-                        
-                        self._save_token(token_data)
-                        self._current_token = token
-                        self._token_expires_at = expires_at
-                        
-                        return {
-                            "success": True,
-                            "token": token,
-                            "user": user,
-                            "expires_at": expires_at.isoformat()
-                        }
-                    else:
-                        return {"success": False, "error": "No token received"}
-                else:
-                    return {"success": False, "error": "Invalid credentials"}
+                    token_data = {
+                        "token": token,
+                        "user": user,
+                        "expires_at": expires_at,
+                        "expires_at_ts": expires_at_ts
+                    }
                     
-            except Exception as e:
-                return {"success": False, "error": f"Connection error: {str(e)}"}
+                    self._save_token(token_data)
+                    self._cached_token_data = token_data
+                    self._set_token(token, expires_at_ts)
+                    self._start_refresh()
+                    
+                    return {"success": True, **token_data}
+                else:
+                    return {"success": False, "error": "No token received"}
+            else:
+                return {"success": False, "error": "Invalid credentials"}
+                
+        except Exception as e:
+            return {"success": False, "error": f"Connection error: {str(e)}"}
     
     async def get_valid_token(self) -> Optional[str]:
         """Get a valid authentication token"""
         # Check current token in memory
-        if (self._current_token and self._token_expires_at and 
-            datetime.now() < self._token_expires_at - timedelta(minutes=5)):
+        if self._current_token and time.monotonic() < self._valid_until:
             return self._current_token
         
-        # Try to load token from file
-        token_data = self._load_token()
-        if token_data and self._is_token_valid(token_data):
-            self._current_token = token_data["token"]
-            self._token_expires_at = datetime.fromisoformat(token_data["expires_at"])
-            return self._current_token
+        # Single-flight: concurrent callers wait for one load or refresh instead of repeating it
+        async with self._refresh_lock:
+            if self._current_token and time.monotonic() < self._valid_until:
+                return self._current_token
+            
+            # Fall back to the stored token record, reading the file only once and off the event loop
+            token_data = self._cached_token_data or await asyncio.to_thread(self._load_token)
+            if token_data and self._is_token_valid(token_data):
+                self._set_token(token_data["token"], self._token_expiry(token_data))
+                self._start_refresh()
+                return self._current_token
         
         return None
     
@@ -116,20 +221,24 @@ class PIAuthService:
         if not token:
             return {"success": False, "error": "No valid token available"}
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    f"{self.payload_url}/api/users/me",
-                    headers={"Authorization": f"JWT {token}"}
-                )
+        return await self._me_with_token(token)
+    
+    async def _me_with_token(self, token: str) -> Dict[str, Any]:
+        """Ask PayloadCMS who a token belongs to"""
+        client = self._get_client()
+        try:
+            response = await client.get(
+                _ME_PATH,
+                headers=self._auth_headers if token == self._current_token else {"Authorization": f"JWT {token}"}
+            )
+            
+            if response.status_code == 200:
+                return {"success": True, "user": response.json().get("user")}
+            else:
+                return {"success": False, "error": "Invalid token"}
                 
-                if response.status_code == 200:
-                    return {"success": True, "user": response.json().get("user")}
-                else:
-                    return {"success": False, "error": "Invalid token"}
-                    
-            except Exception as e:
-                return {"success": False, "error": f"Connection error: {str(e)}"}
+        except Exception as e:
+            return {"success": False, "error": f"Connection error: {str(e)}"}
     
     async def refresh_token(self) -> Dict[str, Any]:
         """Refresh the current token"""
@@ -137,43 +246,53 @@ class PIAuthService:
         if not token:
             return {"success": False, "error": "No token to refresh"}
         
-        async with httpx.AsyncClient() as client:
+        async with self._refresh_lock:
+            if token != self._current_token:
+                # Another caller refreshed the token while this one waited
+                return {"success": True, "token": self._current_token}
+            
+            client = self._get_client()
             try:
                 response = await client.post(
-                    f"{self.payload_url}/api/users/refresh-token",
-                    headers={"Authorization": f"JWT {token}"}
+                    _REFRESH_PATH,
+                    headers=self._auth_headers
                 )
                 
                 if response.status_code == 200:
                     data = response.json()
                     new_token = data.get("token")
                     if new_token:
-                        expires_at = datetime.now() + timedelta(hours=24)
+                        expires_at_ts = time.time() + TOKEN_LIFETIME
                         token_data = {
                             "token": new_token,
                             "user": data.get("user"),
-                            "expires_at": expires_at.isoformat()
+                            "expires_at": datetime.fromtimestamp(expires_at_ts).isoformat(),
+                            "expires_at_ts": expires_at_ts
                         }
                         
                         self._save_token(token_data)
-                        self._current_token = new_token
-                        self._token_expires_at = expires_at
+                        self._cached_token_data = token_data
+                        self._set_token(new_token, expires_at_ts)
                         
-                        return {"success": True, "token": new_token}
+                        return {"success": True, **token_data}
                 
                 return {"success": False, "error": "Could not refresh token"}
-                
+            
             except Exception as e:
                 return {"success": False, "error": f"Connection error: {str(e)}"}
     
     def logout(self) -> None:
         """Clear stored authentication data"""
         self._current_token = None
-        self._token_expires_at = None
+        self._auth_headers = None
+        self._token_expires_at_ts = None
+        self._cached_token_data = None
+        self._valid_until = 0.0
+        self._verified_until = 0.0
+        self._stop_refresh()
         
         try:
-            if self.token_file.exists():
-                self.token_file.unlink()
+            self.token_file.unlink(missing_ok=True)
         except Exception as e:
             print(f"Warning: Could not delete token file: {e}")
     
@@ -183,20 +302,32 @@ class PIAuthService:
         if not token:
             return False
         
+        # A recent successful check is trusted instead of asking the server again
+        if time.monotonic() < self._verified_until:
+            return True
+        
         # Verify token with server
-        user_info = await self.get_user_info(token)
-        return user_info.get("success", False)
+        user_info = await self._me_with_token(token)
+        if user_info.get("success", False):
+            self._verified_until = time.monotonic() + VERIFY_TTL
+            return True
+        return False
 
 
 # Convenience functions for pi-ai integration
-_auth_service = None
+_service_options: Dict[str, Any] = {}
 
+@lru_cache(maxsize=1)
 def get_auth_service() -> PIAuthService:
     """Get global auth service instance"""
-    global _auth_service
-    if _auth_service is None:
-        _auth_service = PIAuthService()
-    return _auth_service
+    return PIAuthService(**_service_options)
+
+def configure_auth_service(payload_url: str = "http://localhost:3000", client: Optional[httpx.AsyncClient] = None) -> PIAuthService:
+    """Set up the global auth service, optionally on an existing PayloadCMS client"""
+    _service_options.clear()
+    _service_options.update(payload_url=payload_url, client=client)
+    get_auth_service.cache_clear()
+    return get_auth_service()
 
 async def get_auth_token() -> Optional[str]:
     """Get current auth token (for pi-ai)"""
@@ -9,39 +9,52 @@ import os
 import sys
 import asyncio
 import httpx
+from importlib.util import find_spec
 from pathlib import Path
 
+from services import configure_auth_service, create_payload_client
+
 def check_dependencies():
     """Check if all required dependencies are installed"""
-    try:
-        import fastapi
-        import uvicorn
-        import jinja2
-        import httpx
-        print("✅ All dependencies are installed")
-        return True
-    except ImportError as e:
-        print(f"❌ Missing dependency: {e}")
+    # find_spec only locates the packages, so fastapi & co. are not imported twice
+    missing = [name for name in ("fastapi", "uvicorn", "jinja2", "httpx") if find_spec(name) is None]
+    if missing:
+        print(f"❌ Missing dependency: {', '.join(missing)}")
         print("Please run: pip install -r requirements.txt")
         return False
+    print("✅ All dependencies are installed")
+    return True
 
-async def check_backend_connection():
+# Cheap PayloadCMS endpoints probed at startup: the site root and the auth API pi-ai relies on
+BACKEND_PROBES = ("/", "/api/users/me")
+
+async def check_backend_connection(client: httpx.AsyncClient):
     """Check if PayloadCMS backend is accessible"""
-    backend_url = "http://localhost:3000"
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{backend_url}/api/users", timeout=5.0)
-            if response.status_code in [200, 401]:  # 401 is expected without auth
-                print(f"✅ PayloadCMS backend is accessible at {backend_url}")
-                return True
-            else:
-                print(f"⚠️  PayloadCMS backend returned status {response.status_code}")
-                return False
-    except Exception as e:
+    backend_url = str(client.base_url).rstrip("/")
+    # HEAD requests are answered without querying collections; all probes run at once
+    results = await asyncio.gather(
+        *(client.head(path, timeout=2.0) for path in BACKEND_PROBES),
+        return_exceptions=True
+    )
+    
+    errors = [(path, result) for path, result in zip(BACKEND_PROBES, results) if isinstance(result, Exception)]
+    if len(errors) == len(BACKEND_PROBES):
         print(f"❌ Cannot connect to PayloadCMS backend at {backend_url}")
-        print(f"   Error: {e}")
+        print(f"   Error: {errors[0][1]}")
         print("   Make sure the backend is running with: npm run dev")
         return False
+    
+    failures = [
+        f"{path} -> {result if isinstance(result, Exception) else result.status_code}"
+        for path, result in zip(BACKEND_PROBES, results)
+        if isinstance(result, Exception) or result.status_code >= 500
+    ]
+    if failures:
+        print(f"⚠️  PayloadCMS backend at {backend_url} is not fully healthy: {', '.join(failures)}")
+        return False
+    
+    print(f"✅ PayloadCMS backend is accessible at {backend_url}")
+    return True
 
 def create_env_file():
     """Create a .env file with default configuration if it doesn't exist"""
@@ -53,6 +66,9 @@ SESSION_SECRET=your-secret-key-change-in-production
 FRONTEND_HOST=0.0.0.0
 FRONTEND_PORT=8080
 DEBUG=true
+RELOAD=0
+# More than one worker requires REDIS_URL, otherwise logins aren't shared between workers
+WORKERS=1
 """
         with open(env_file, 'w') as f:
             f.write(env_content)
@@ -64,28 +80,41 @@ def load_env():
     """Load environment variables from .env file"""
     env_file = Path(".env")
     if env_file.exists():
-        with open(env_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key] = value
+        updates = {}
+        for line in env_file.read_text().splitlines():
+            line = line.strip()
+            if not line or line[0] == '#' or '=' not in line:
+                continue
+            key, _, value = line.partition('=')
+            updates[key] = value
+        os.environ.update(updates)
 
 async def main():
     """Main startup function"""
     print("🚀 Starting PI-LMS Frontend Server")
     print("=" * 50)
     
+    # Create and load environment first, so PAYLOAD_CMS_URL from .env reaches the client below
+    create_env_file()
+    load_env()
+    
+    # One PayloadCMS client serves the startup probe and the shared auth service
+    payload_url = os.getenv('PAYLOAD_CMS_URL', 'http://localhost:3000')
+    client = create_payload_client(payload_url)
+    configure_auth_service(payload_url, client=client)
+    
+    # Probe the backend while the dependencies are checked locally
+    backend_task = asyncio.create_task(check_backend_connection(client))
+    await asyncio.sleep(0)  # Let the probe start connecting before the blocking checks
+    
     # Check dependencies
     if not check_dependencies():
+        backend_task.cancel()
+        await client.aclose()
         sys.exit(1)
     
-    # Create and load environment
-    create_env_file()
-    load_env()
-    
     # Check backend connection
-    backend_ok = await check_backend_connection()
+    backend_ok = await backend_task
     if not backend_ok:
         print("\n⚠️  Backend not accessible, but frontend will still start")
         print("   Some features may not work until backend is available")
@@ -103,22 +132,37 @@ async def main():
     print("   GET  /api/token - Auth token (for pi-ai)")
     print("\n💡 Tips:")
     print("   - Use Ctrl+C to stop the server")
-    print("   - The server will auto-reload on code changes")
+    print("   - Set RELOAD=1 to auto-reload on code changes")
     print("   - Check browser console for any JavaScript errors")
     print("   - Login credentials are managed through PayloadCMS admin")
     
+    # Reload polls the source tree, so it is opt-in; it also rules out multiple workers
+    reload = os.getenv('RELOAD', '0') == '1'
+    workers = 1 if reload else int(os.getenv('WORKERS', '1'))
+    # Without Redis, sessions and caches live in each worker's memory, so a login handled
+    # by one worker would be unknown to the others
+    if workers > 1 and not os.getenv('REDIS_URL'):
+        print(f"\n⚠️  WORKERS={workers} needs REDIS_URL for shared sessions; starting a single worker")
+        workers = 1
+    server_options = {
+        "host": os.getenv('FRONTEND_HOST', '0.0.0.0'),
+        "port": int(os.getenv('FRONTEND_PORT', '8080')),
+        "log_level": "info",
+        "loop": "uvloop" if find_spec("uvloop") else "auto",
+        "http": "httptools" if find_spec("httptools") else "auto",
+    }
+    
     try:
+        if reload or workers > 1:
+            # The reloader and worker supervisors import the app by name and
+            # must run outside this event loop, so hand them back to __main__
+            return {"app": "main:app", "reload": reload, "workers": workers, **server_options}
+        
         import uvicorn
         from main import app
         
         # Start the server
-        config = uvicorn.Config(
-            app=app,
-            host=os.getenv('FRONTEND_HOST', '0.0.0.0'),
-            port=int(os.getenv('FRONTEND_PORT', '8080')),
-            reload=os.getenv('DEBUG', 'true').lower() == 'true',
-            log_level="info"
-        )
+        config = uvicorn.Config(app=app, **server_options)
         server = uvicorn.Server(config)
         await server.serve()
         
@@ -127,6 +171,9 @@ async def main():
     except Exception as e:
         print(f"\n❌ Server error: {e}")
         sys.exit(1)
+    finally:
+        # Release the pooled PayloadCMS connections shared with the auth service
+        await client.aclose()
 
 if __name__ == "__main__":
     # Check if we're in the right directory
@@ -137,6 +184,9 @@ if __name__ == "__main__":
     
     # Run the startup
     try:
-        asyncio.run(main())
+        supervised_options = asyncio.run(main())
+        if supervised_options:
+            import uvicorn
+            uvicorn.run(**supervised_options)
     except KeyboardInterrupt:
         print("\n👋 Goodbye!")
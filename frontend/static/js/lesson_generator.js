@@ -575,7 +575,8 @@ formData.append('prompt', combinedPrompt);
                 const submitData = {
                     selected_videos: this.selectedVideos,
                     lesson_data: finalLessonData,
-                    auth_token: tokenData.token
+                    auth_token: tokenData.token,
+                    session_id: this.sessionId
                 };
                 
                 // Submit to pi-ai
@@ -590,9 +591,6 @@ formData.append('prompt', combinedPrompt);
                 if (response.ok) {
                     const result = await response.json();
                     
-                    // Cleanup temporary files
-                    await fetch('http://localhost:8000/cleanup/', { method: 'POST' });
-                    
                     // Clear session state
                     this.clearSessionState();
                     
@@ -1,23 +1,111 @@
-from fastapi import FastAPI, UploadFile, File, Form, Body, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Body, Depends, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.websockets import WebSocketState
 import uvicorn
 import pathlib
-import json
 import os
 import re
+import secrets
+import time
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from importlib.util import find_spec
+from cachetools import TTLCache
+import orjson
+import aiofiles
 from services import etts, gemini, youtube, payload
 from services.chatbot import ChatbotService
 from services.llm import get_llm_service
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 import asyncio
+import logging
 
 load_dotenv()
 
-app = FastAPI()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+PROGRESS_TTL = int(os.getenv("PROGRESS_TTL", "3600"))
+PROGRESS_MAX_SESSIONS = int(os.getenv("PROGRESS_MAX_SESSIONS", "10000"))
+# Generated audio/video and uploaded PDFs, created once at startup
+MEDIA_DIR = pathlib.Path("media")
+TEMP_DIR = pathlib.Path("temp")
+# Number of worker processes for the Gemini pipeline steps; 0 runs them in threads instead
+PIPELINE_PROCESSES = int(os.getenv("PIPELINE_PROCESSES", "0"))
+JANITOR_INTERVAL = 60
+# How long a failed session's progress stays around for clients still polling it
+ERROR_RETENTION = 300
+
+async def _janitor():
+    """Periodically drop closed websockets and stale progress entries"""
+    while True:
+        await asyncio.sleep(JANITOR_INTERVAL)
+        for session_id, websocket in list(manager.active_connections.items()):
+            if websocket.client_state != WebSocketState.CONNECTED:
+                manager.disconnect(session_id)
+
+        progress_tracker.expire()
+        # Delete the files of sessions abandoned before /finish/ or cancellation cleaned them up
+        session_artifacts.expire()
+        orphaned, session_artifacts.orphaned = session_artifacts.orphaned, []
+        if orphaned:
+            await asyncio.to_thread(_unlink_files, orphaned)
+        cutoff = datetime.now().timestamp() - ERROR_RETENTION
+        for session_id, progress_data in list(progress_tracker.items()):
+            if progress_data.get("stage") == "error" and datetime.fromisoformat(progress_data["timestamp"]).timestamp() < cutoff:
+                progress_tracker.pop(session_id, None)
+
+# Idle chat sessions are also dropped when looked up; the sweep frees the ones nobody comes back to
+CHAT_CLEANUP_INTERVAL = 3600
+
+async def _chat_session_sweeper():
+    """Periodically drop expired chat sessions, off the request path"""
+    while True:
+        await asyncio.sleep(CHAT_CLEANUP_INTERVAL)
+        try:
+            chatbot_service.cleanup_old_sessions()
+        except Exception:
+            logger.exception("Error cleaning up chat sessions")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the working directories, then run the janitor, the chat session sweeper and the optional Gemini process pool for the lifetime of the app"""
+    MEDIA_DIR.mkdir(parents=True, exist_ok=True)
+    TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    app.state.pool = ProcessPoolExecutor(max_workers=PIPELINE_PROCESSES) if PIPELINE_PROCESSES > 0 else None
+    janitor = asyncio.create_task(_janitor())
+    chat_sweeper = asyncio.create_task(_chat_session_sweeper())
+    try:
+        yield
+    finally:
+        janitor.cancel()
+        chat_sweeper.cancel()
+        await payload.aclose()
+        await chatbot_service.aclose()
+        if app.state.pool is not None:
+            app.state.pool.shutdown(wait=False, cancel_futures=True)
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Opt-in request profiling: with ENABLE_PROFILING=true, add ?profile=1 to any request to get
+# a pyinstrument report instead of the response (pyinstrument is a dev-only dependency)
+if os.getenv("ENABLE_PROFILING", "false").lower() == "true":
+    from pyinstrument import Profiler
+
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        if not request.query_params.get("profile"):
+            return await call_next(request)
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        await call_next(request)
+        profiler.stop()
+        return HTMLResponse(profiler.output_html())
 
 # Get CORS origins from environment variable
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:8080,http://localhost:8081,http://localhost:3000,http://localhost:8000").split(",")
@@ -32,28 +120,62 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+async def send_frame(websocket: WebSocket, data: dict):
+    """
+    Send a JSON frame encoded with orjson. Sent as text rather than bytes because
+    browsers hand binary frames to onmessage as Blobs, which JSON.parse can't read.
+    """
+    await websocket.send_text(orjson.dumps(data).decode())
+
+PROGRESS_FIELDS = ("stage", "progress", "message", "timestamp")
+
 # WebSocket connection manager
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.writers: Dict[str, asyncio.Task] = {}
 
     async def connect(self, websocket: WebSocket, session_id: str):
         await websocket.accept()
+        self.disconnect(session_id)
         self.active_connections[session_id] = websocket
-        print(f"WebSocket connected for session: {session_id}")
+        self.queues[session_id] = queue = asyncio.Queue()
+        self.writers[session_id] = asyncio.create_task(self._writer(session_id, websocket, queue))
+        logger.debug("WebSocket connected for session: %s", session_id)
 
     def disconnect(self, session_id: str):
-        if session_id in self.active_connections:
-            del self.active_connections[session_id]
-            print(f"WebSocket disconnected for session: {session_id}")
+        self.queues.pop(session_id, None)
+        writer = self.writers.pop(session_id, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+        if self.active_connections.pop(session_id, None) is not None:
+            logger.debug("WebSocket disconnected for session: %s", session_id)
 
     async def send_progress_update(self, session_id: str, data: dict):
-        if session_id in self.active_connections:
+        # Hand the update to the connection's writer task. Only the progress fields are queued:
+        # the tracker entry is mutated afterwards and carries lesson_data once complete, which
+        # clients fetch from /lesson-result/ instead
+        queue = self.queues.get(session_id)
+        if queue is not None:
+            queue.put_nowait({key: data[key] for key in PROGRESS_FIELDS if key in data})
+
+    async def _writer(self, session_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        """
+        Send queued progress to one client. Each frame is a full snapshot, so when several
+        updates are waiting only the latest is sent.
+        """
+        while True:
+            data = await queue.get()
+            while not queue.empty():
+                data = queue.get_nowait()
+
             try:
-                await self.active_connections[session_id].send_json(data)
+                await send_frame(websocket, data)
             except Exception as e:
-                print(f"Failed to send progress update to {session_id}: {e}")
+                logger.warning("Failed to send progress update to %s: %s", session_id, e)
                 self.disconnect(session_id)
+                return
 
 manager = ConnectionManager()
 
@@ -61,20 +183,56 @@ manager = ConnectionManager()
 chatbot_service = ChatbotService()
 llm_service = get_llm_service()
 
+PROMPTS_CONFIG_PATH = pathlib.Path("config/prompts.json")
+FALLBACK_FOUNDATION_PROMPT = "Create a comprehensive educational lesson from the provided PDF content."
+
+@lru_cache(maxsize=1)
+def _parse_prompts_config(mtime: float) -> dict:
+    # Keyed on the file's mtime so edits to prompts.json are picked up without a restart
+    return orjson.loads(PROMPTS_CONFIG_PATH.read_bytes())
+
+def load_prompts_config() -> Optional[dict]:
+    """
+    Return the parsed prompts.json, re-reading it only when the file changes.
+    Returns None if the file does not exist.
+    """
+    try:
+        mtime = PROMPTS_CONFIG_PATH.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    return _parse_prompts_config(mtime)
+
 # Function to load foundation prompt
 def load_foundation_prompt():
     try:
-        config_path = pathlib.Path("config/prompts.json")
-        if config_path.exists():
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                return config.get("foundation_prompt", "")
+        config = load_prompts_config()
+        if config is not None:
+            return config.get("foundation_prompt", "")
         else:
-            print("Warning: prompts.json not found, using fallback prompt")
-            return "Create a comprehensive educational lesson from the provided PDF content."
+            logger.warning("prompts.json not found, using fallback prompt")
+            return FALLBACK_FOUNDATION_PROMPT
     except Exception as e:
-        print(f"Error loading foundation prompt: {e}")
-        return "Create a comprehensive educational lesson from the provided PDF content."
+        logger.error("Error loading foundation prompt: %s", e)
+        return FALLBACK_FOUNDATION_PROMPT
+
+async def run_pipeline_step(func, *args):
+    """
+    Run a blocking Gemini step off the event loop: in the process pool when PIPELINE_PROCESSES
+    is set (so response parsing/validation isn't GIL-bound), otherwise in a worker thread.
+    """
+    pool = app.state.pool
+    if pool is None:
+        return await asyncio.to_thread(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+# Static attributes of the Lexical root node wrapping generated lesson content
+LEXICAL_ROOT = {
+    "direction": "ltr",
+    "format": "",
+    "indent": 0,
+    "type": "root",
+    "version": 1
+}
 
 async def generate_lesson_task(
     session_id: str,
@@ -88,81 +246,75 @@ async def generate_lesson_task(
         # 1. Gemini: PDF to Lexical JSON
         await update_progress(session_id, "processing", 10, "Analyzing PDF content...")
         try:
-            lexical_children = gemini.pdf_to_lexical(str(temp_path), prompt)
+            lexical_children = await run_pipeline_step(gemini.pdf_to_lexical, str(temp_path), prompt)
             if isinstance(lexical_children, str):
-                lexical_children = json.loads(lexical_children)
+                lexical_children = orjson.loads(lexical_children)
             await update_progress(session_id, "processing", 40, "PDF content analysis complete")
         except Exception as e:
             await update_progress(session_id, "error", 100, f"AI content analysis failed: {str(e)}")
             return
 
         # 2. Gemini: Generate narration and keywords
-        await update_progress(session_id, "processing", 40, "Generating audio narration script...")
-        try:
-            narration = gemini.lexical_to_narration(lexical_children)
-            await update_progress(session_id, "processing", 55, "Audio narration script generated")
-        except Exception as e:
-            await update_progress(session_id, "error", 100, f"Audio narration script generation failed: {str(e)}")
+        # Both only depend on the lexical content, so run them side by side
+        await update_progress(session_id, "processing", 40, "Generating audio narration script and extracting keywords...")
+        narration, keywords = await asyncio.gather(
+            run_pipeline_step(gemini.lexical_to_narration, lexical_children),
+            run_pipeline_step(gemini.get_keywords, lexical_children),
+            return_exceptions=True
+        )
+        if isinstance(narration, Exception):
+            await update_progress(session_id, "error", 100, f"Audio narration script generation failed: {str(narration)}")
             return
+        await update_progress(session_id, "processing", 55, "Audio narration script generated")
 
-        await update_progress(session_id, "processing", 55, "Extracting keywords...")
-        try:
-            keywords = gemini.get_keywords(lexical_children)
-            await update_progress(session_id, "processing", 70, "Keywords extracted successfully")
-        except Exception as e:
+        if isinstance(keywords, Exception):
             keywords = ["education", "learning", title.lower()]
             await update_progress(session_id, "processing", 70, "Keywords extracted (fallback)")
+        else:
+            await update_progress(session_id, "processing", 70, "Keywords extracted successfully")
 
-        # 3. YouTube: Auto-search for videos
-        await update_progress(session_id, "youtube", 70, "Searching for relevant videos...")
-        try:
-            youtube_videos = youtube.search_videos(keywords, max_results=10)
-            await update_progress(session_id, "youtube", 80, f"Found {len(youtube_videos)} educational videos")
-        except Exception as e:
+        # 3. YouTube search and 4. Edge TTS narration run concurrently
+        await update_progress(session_id, "youtube", 70, "Searching for relevant videos and generating audio narration...")
+        audio_path = MEDIA_DIR / f"narration_{session_id}_{secrets.token_hex(4)}.mp3"
+        track_artifact(session_id, audio_path)
+        youtube_videos, audio_result = await asyncio.gather(
+            asyncio.to_thread(youtube.search_videos, keywords, 10),
+            etts.text_to_mp3(narration, str(audio_path)),
+            return_exceptions=True
+        )
+
+        if isinstance(youtube_videos, Exception):
             youtube_videos = []
             await update_progress(session_id, "youtube", 80, "Video search completed (0 found or error)")
+        else:
+            await update_progress(session_id, "youtube", 80, f"Found {len(youtube_videos)} educational videos")
 
-        # 4. Edge TTS: Generate audio narration
-        await update_progress(session_id, "youtube", 80, "Generating audio narration file...")
-        audio_path = None
-        try:
-            audio_dir = pathlib.Path("media")
-            audio_dir.mkdir(exist_ok=True)
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            audio_path = audio_dir / f"narration_{timestamp}.mp3"
-            await etts.text_to_mp3(narration, str(audio_path))
-            await update_progress(session_id, "youtube", 95, "Audio narration file generated")
-        except Exception as e:
+        if isinstance(audio_result, Exception):
             audio_path = None
             await update_progress(session_id, "youtube", 95, "Audio generation failed")
+        else:
+            narration_paths[session_id] = audio_path
+            await update_progress(session_id, "youtube", 95, "Audio narration file generated")
 
         # 5. Finalize: Construct lesson data and mark as complete
         lesson_data = {
             "title": title,
             "courseId": course_id,
-            "content": {"root": {"children": lexical_children}},
             "narration": narration,
-            "content": {
-                "root": {
-                    "children": lexical_children,
-                    "direction": "ltr",
-                    "format": "",
-                    "indent": 0,
-                    "type": "root",
-                    "version": 1
-                }
-            },
+            "content": {"root": {**LEXICAL_ROOT, "children": lexical_children}},
             "published": True,
             "course": {"id": course_id},
         }
 
         await update_progress(session_id, "selection", 100, "Lesson ready for video selection")
-        print("✓ Lesson generation completed successfully")
+        logger.info("Lesson generation completed for session %s", session_id)
         
         # Store lesson result for later retrieval instead of cleaning up immediately
-        progress_tracker[session_id]["lesson_data"] = lesson_data
-        progress_tracker[session_id]["keywords"] = keywords
-        progress_tracker[session_id]["youtube_videos"] = youtube_videos
+        progress_tracker[session_id].update(
+            lesson_data=lesson_data,
+            keywords=keywords,
+            youtube_videos=youtube_videos
+        )
         
         # Note: Don't clean up progress_tracker here - we need it for lesson-result endpoint
 
@@ -170,20 +322,22 @@ async def generate_lesson_task(
         # Re-raise HTTP exceptions (these have user-friendly messages)
         raise
     except Exception as e:
-        print(f"✗ Unexpected error during lesson generation: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unexpected error during lesson generation for session %s", session_id)
         raise HTTPException(status_code=500, detail=f"Lesson generation failed: {str(e)}")
     finally:
         # Always clean up temp file
         if temp_path and temp_path.exists():
             temp_path.unlink(missing_ok=True)
-            print(f"Cleaned up temp file: {temp_path}")
+            logger.debug("Cleaned up temp file: %s", temp_path)
+
+# Maximum number of selected videos downloaded/uploaded at the same time
+VIDEO_CONCURRENCY = int(os.getenv("VIDEO_CONCURRENCY", "4"))
 
 class FinishRequest(BaseModel):
     selected_videos: List[Dict]
     lesson_data: Dict
     auth_token: str
+    session_id: Optional[str] = None
 
 @app.post("/finish/")
 async def finish(request: FinishRequest):
@@ -198,68 +352,83 @@ async def finish(request: FinishRequest):
         # Look for audio content in the lesson data or try to find generated audio
         # For now, we'll create a placeholder since the actual audio handling needs the services
         try:
-            # Try to find the most recent audio file in media directory
-            media_dir = pathlib.Path("media")
-            if media_dir.exists():
-                audio_files = list(media_dir.glob("narration_*.mp3"))
+            if request.session_id:
+                # The narration generated for this session, if any
+                audio_path = narration_paths.get(request.session_id)
+            elif MEDIA_DIR.exists():
+                # Older clients don't send their session id; fall back to the most recent audio file
+                audio_files = list(MEDIA_DIR.glob("narration_*.mp3"))
                 if audio_files:
-                    # Get the most recent audio file
                     audio_path = max(audio_files, key=lambda p: p.stat().st_mtime)
-                    audio_alt = f"audio_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                    
-                    # Upload to Payload CMS
-                    audio_payload = payload.upload_media(str(audio_path), media_type="audio", alt=audio_alt, auth_token=request.auth_token)
-                    
-                    # Handle different possible response structures
-                    media_id = audio_payload.get("id") or audio_payload.get("doc", {}).get("id")
-                    audio_metadata = {
-                        "type": "upload",
-                        "version": 3,
-                        "format": "",
-                        "id": audio_alt,
-                        "fields": None,
-                        "relationTo": "media",
-                        "value": media_id
-                    }
-        except Exception as e:
-            print(f"Warning: Audio upload failed: {e}")
-            # Continue without audio
 
-        # Download and upload each selected video
-        video_nodes = []
-        for idx, video in enumerate(request.selected_videos):
-            try:
-                video_url = video["url"]
-                # Download video to local media directory
-                video_dir = pathlib.Path("media")
-                video_dir.mkdir(exist_ok=True)
-                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                video_filename = f"video_{idx}_{timestamp}.mp4"
-                video_path = video_dir / video_filename
-                youtube.download_video(video_url, str(video_path))
+            if audio_path:
+                audio_alt = f"audio_{secrets.token_hex(4)}"
                 
                 # Upload to Payload CMS
-                video_alt = f"video_{idx}_{timestamp}"
-                payload_result = payload.upload_media(str(video_path), media_type="video", alt=video_alt, auth_token=request.auth_token)
+                audio_payload = await payload.upload_media(
+                    str(audio_path), media_type="audio", alt=audio_alt, auth_token=request.auth_token
+                )
                 
                 # Handle different possible response structures
-                video_media_id = payload_result.get("id") or payload_result.get("doc", {}).get("id")
-                # Prepare video metadata node (type 'upload', relationTo 'media')
-                video_metadata = {
+                media_id = audio_payload.get("id") or audio_payload.get("doc", {}).get("id")
+                audio_metadata = {
                     "type": "upload",
                     "version": 3,
                     "format": "",
-                    "id": video_alt,  # Use alt as Lexical node ID
+                    "id": audio_alt,
                     "fields": None,
                     "relationTo": "media",
-                    "value": video_media_id  # Use the media ID directly
+                    "value": media_id
                 }
-                video_nodes.append(video_metadata)
-                # Optionally, delete local video file after upload
-                video_path.unlink(missing_ok=True)
-            except Exception as e:
-                print(f"Warning: Video {idx} upload failed: {e}")
-                # Continue with other videos
+        except Exception as e:
+            logger.warning("Audio upload failed: %s", e)
+            # Continue without audio
+
+        # Download and upload the selected videos concurrently, a few at a time
+        video_semaphore = asyncio.Semaphore(VIDEO_CONCURRENCY)
+
+        async def process_video(idx: int, video: Dict) -> Optional[Dict]:
+            async with video_semaphore:
+                # Download video to local media directory
+                suffix = secrets.token_hex(4)
+                video_filename = f"video_{idx}_{suffix}.mp4"
+                video_path = MEDIA_DIR / video_filename
+                if request.session_id:
+                    track_artifact(request.session_id, video_path)
+                try:
+                    video_url = video["url"]
+                    await asyncio.to_thread(youtube.download_video, video_url, str(video_path))
+
+                    # Upload to Payload CMS
+                    video_alt = f"video_{idx}_{suffix}"
+                    payload_result = await payload.upload_media(
+                        str(video_path), media_type="video", alt=video_alt, auth_token=request.auth_token
+                    )
+
+                    # Handle different possible response structures
+                    video_media_id = payload_result.get("id") or payload_result.get("doc", {}).get("id")
+                    # Prepare video metadata node (type 'upload', relationTo 'media')
+                    return {
+                        "type": "upload",
+                        "version": 3,
+                        "format": "",
+                        "id": video_alt,  # Use alt as Lexical node ID
+                        "fields": None,
+                        "relationTo": "media",
+                        "value": video_media_id  # Use the media ID directly
+                    }
+                except Exception as e:
+                    logger.warning("Video %d upload failed: %s", idx, e)
+                    # Continue with other videos
+                    return None
+                finally:
+                    # The local copy is only needed for the upload, whether or not it succeeded
+                    video_path.unlink(missing_ok=True)
+
+        video_results = await asyncio.gather(
+            *(process_video(idx, video) for idx, video in enumerate(request.selected_videos))
+        )
+        video_nodes = [node for node in video_results if node]
 
         # Build final lexical children structure
         final_children = []
@@ -278,74 +447,115 @@ async def finish(request: FinishRequest):
         request.lesson_data["content"]["root"]["children"] = final_children
 
         # Upload the lesson to Payload CMS
-        lesson_upload_result = payload.upload_lesson(request.lesson_data, auth_token=request.auth_token)
+        lesson_upload_result = await payload.upload_lesson(request.lesson_data, auth_token=request.auth_token)
+
+        # The lesson is stored, so this session's uploaded PDF and narration are no longer needed.
+        # Other sessions' files are left alone
+        if request.session_id:
+            narration_paths.pop(request.session_id, None)
+            await asyncio.to_thread(_unlink_files, session_artifacts.pop(request.session_id, []))
 
-        return JSONResponse(content={"lesson": request.lesson_data, "payload_result": lesson_upload_result})
+        return ORJSONResponse(content={"lesson": request.lesson_data, "payload_result": lesson_upload_result})
         
     except Exception as e:
-        print(f"Error in finish endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in finish endpoint")
         raise HTTPException(status_code=500, detail=f"Failed to finish lesson: {str(e)}")
 
-# Global progress tracking
-progress_tracker = {}
+# Global progress tracking, bounded so abandoned sessions don't hold lesson data forever.
+# Only touched from the event loop thread, so no extra locking is needed.
+progress_tracker = TTLCache(maxsize=PROGRESS_MAX_SESSIONS, ttl=PROGRESS_TTL)
+class ArtifactCache(TTLCache):
+    """
+    Per-session file lists whose files outlive the entry: paths of sessions that expire or are
+    evicted are collected in `orphaned` for the janitor to delete off the event loop.
+    """
+
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.orphaned: List[pathlib.Path] = []
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, paths in expired:
+            self.orphaned.extend(paths)
+        return expired
+
+    def popitem(self):
+        key, paths = super().popitem()
+        self.orphaned.extend(paths)
+        return key, paths
+
+# Files created for each session, so cancelling one doesn't touch another session's files.
+# Kept apart from progress_tracker because update_progress replaces those entries.
+session_artifacts = ArtifactCache(maxsize=PROGRESS_MAX_SESSIONS, ttl=PROGRESS_TTL)
+
+# Narration audio per session, looked up by /finish/ after /lesson-result/ has dropped the progress entry
+narration_paths = TTLCache(maxsize=PROGRESS_MAX_SESSIONS, ttl=PROGRESS_TTL)
+
+def track_artifact(session_id: str, path: pathlib.Path):
+    # Reassigned rather than appended so the entry's TTL restarts with every new file; a
+    # session that was already finished or cancelled gets a fresh entry the janitor expires
+    session_artifacts[session_id] = session_artifacts.get(session_id, []) + [path]
 
 @app.post("/cleanup/")
 async def cleanup():
     """
     Cleanup endpoint to handle failed or cancelled lesson generation.
-    Removes temporary files and performs any necessary cleanup.
+    Removes the temporary files of every session, so it is meant for maintenance;
+    /finish/ and cancellation only remove their own session's files.
     """
     try:
-        print("Performing cleanup...")
-        cleaned_files = 0
-        
-        # Clean up media directory (audio and video files)
-        media_dir = pathlib.Path("media")
-        if media_dir.exists():
-            for file_path in media_dir.glob("*"):
-                if file_path.is_file():
-                    try:
-                        file_path.unlink()
-                        print(f"Cleaned up media file: {file_path}")
-                        cleaned_files += 1
-                    except Exception as e:
-                        print(f"Failed to clean up {file_path}: {e}")
-        
-        # Clean up temp directory
-        temp_dir = pathlib.Path("temp")
-        if temp_dir.exists():
-            for file_path in temp_dir.glob("*"):
-                if file_path.is_file():
-                    try:
-                        file_path.unlink()
-                        print(f"Cleaned up temp file: {file_path}")
-                        cleaned_files += 1
-                    except Exception as e:
-                        print(f"Failed to clean up {file_path}: {e}")
-        
-        print(f"Cleanup completed - removed {cleaned_files} files")
-        return JSONResponse(content={"status": "cleaned", "message": f"Cleanup completed - removed {cleaned_files} files"})
+        logger.info("Performing cleanup...")
+        # Directory scans and unlinks are blocking, keep them off the event loop
+        cleaned_files = await asyncio.to_thread(_clear_directories, (MEDIA_DIR, TEMP_DIR))
+        logger.info("Cleanup completed - removed %d files", cleaned_files)
+        return ORJSONResponse(content={"status": "cleaned", "message": f"Cleanup completed - removed {cleaned_files} files"})
         
     except Exception as e:
-        print(f"Cleanup error: {e}")
-        return JSONResponse(content={"status": "error", "message": f"Cleanup failed: {str(e)}"}, status_code=500)
+        logger.exception("Cleanup error")
+        return ORJSONResponse(content={"status": "error", "message": f"Cleanup failed: {str(e)}"}, status_code=500)
+
+def _unlink_files(paths) -> int:
+    """Delete the given files, returning how many were removed"""
+    removed = 0
+    for file_path in paths:
+        try:
+            file_path.unlink()
+            logger.debug("Cleaned up file: %s", file_path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Failed to clean up %s: %s", file_path, e)
+    return removed
+
+def _clear_directories(directories) -> int:
+    """Delete every file in the given directories"""
+    removed = 0
+    for directory in directories:
+        if directory.exists():
+            removed += _unlink_files(path for path in directory.glob("*") if path.is_file())
+    return removed
 
 @app.get("/progress/{session_id}")
 async def get_progress(session_id: str):
     """
     Get the current progress of a lesson generation session.
     """
-    if session_id in progress_tracker:
-        return JSONResponse(content=progress_tracker[session_id])
+    progress_data = progress_tracker.get(session_id)
+    if progress_data is not None:
+        return ORJSONResponse(content=progress_data)
     else:
-        return JSONResponse(content={"error": "Session not found"}, status_code=404)
+        return ORJSONResponse(content={"error": "Session not found"}, status_code=404)
 
 async def update_progress(session_id: str, stage: str, progress: int, message: str):
     """
     Update the progress for a specific session and send WebSocket update.
     """
+    current = progress_tracker.get(session_id)
+    if current and current["stage"] == stage and current["progress"] == progress and current["message"] == message:
+        return
+
     progress_data = {
         "stage": stage,
         "progress": progress,
@@ -353,7 +563,7 @@ async def update_progress(session_id: str, stage: str, progress: int, message: s
         "timestamp": datetime.now().isoformat()
     }
     progress_tracker[session_id] = progress_data
-    print(f"Progress Update [{session_id}]: {stage} - {progress}% - {message}")
+    logger.info("Progress Update [%s]: %s - %d%% - %s", session_id, stage, progress, message)
     
     # Send WebSocket update if client is connected
     await manager.send_progress_update(session_id, progress_data)
@@ -366,18 +576,20 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
     await manager.connect(websocket, session_id)
     try:
         # Send current progress if session exists
-        if session_id in progress_tracker:
-            await manager.send_progress_update(session_id, progress_tracker[session_id])
-        
-        # Keep connection alive
-        while True:
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        manager.disconnect(session_id)
-        print(f"WebSocket disconnected for session: {session_id}")
+        progress_data = progress_tracker.get(session_id)
+        if progress_data is not None:
+            await manager.send_progress_update(session_id, progress_data)
+
+        # Clients never send anything here, so just wait for the close frame
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        logger.debug("WebSocket disconnected for session: %s", session_id)
     except Exception as e:
-        print(f"WebSocket error for session {session_id}: {e}")
-        manager.disconnect(session_id)
+        logger.warning("WebSocket error for session %s: %s", session_id, e)
+    finally:
+        # A reconnect for the same session may already have replaced this socket
+        if manager.active_connections.get(session_id) is websocket:
+            manager.disconnect(session_id)
 
 @app.post("/cancel-lesson-generation/{session_id}")
 async def cancel_lesson_generation(session_id: str):
@@ -386,8 +598,7 @@ async def cancel_lesson_generation(session_id: str):
     """
     try:
         # Remove from progress tracker
-        if session_id in progress_tracker:
-            del progress_tracker[session_id]
+        progress_tracker.pop(session_id, None)
         
         # Disconnect WebSocket if connected
         manager.disconnect(session_id)
@@ -401,13 +612,14 @@ async def cancel_lesson_generation(session_id: str):
         }
         await manager.send_progress_update(session_id, cancellation_data)
         
-        # Trigger cleanup
-        await cleanup()
+        # Only remove this session's files; other generations may be running
+        artifacts = session_artifacts.pop(session_id, [])
+        await asyncio.to_thread(_unlink_files, artifacts)
         
-        return JSONResponse(content={"status": "cancelled", "message": "Lesson generation cancelled successfully"})
+        return ORJSONResponse(content={"status": "cancelled", "message": "Lesson generation cancelled successfully"})
     except Exception as e:
-        print(f"Error cancelling lesson generation: {e}")
-        return JSONResponse(content={"status": "error", "message": f"Failed to cancel: {str(e)}"}, status_code=500)
+        logger.exception("Error cancelling lesson generation")
+        return ORJSONResponse(content={"status": "error", "message": f"Failed to cancel: {str(e)}"}, status_code=500)
 
 @app.get("/foundation-prompt")
 async def get_foundation_prompt():
@@ -416,20 +628,16 @@ async def get_foundation_prompt():
     """
     try:
         foundation_prompt = load_foundation_prompt()
-        config_path = pathlib.Path("config/prompts.json")
-        config = {}
-        if config_path.exists():
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+        config = load_prompts_config() or {}
         
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "foundation_prompt": foundation_prompt,
             "description": config.get("description", ""),
             "version": config.get("version", "1.0")
         })
     except Exception as e:
-        print(f"Error getting foundation prompt: {e}")
-        return JSONResponse(content={"error": f"Failed to get prompt: {str(e)}"}, status_code=500)
+        logger.exception("Error getting foundation prompt")
+        return ORJSONResponse(content={"error": f"Failed to get prompt: {str(e)}"}, status_code=500)
 
 @app.post("/search-youtube/")
 async def search_youtube(keywords: list = Body(..., embed=True)):
@@ -438,9 +646,12 @@ async def search_youtube(keywords: list = Body(..., embed=True)):
     Expects: {"keywords": ["keyword1", "keyword2", ...]}
     Returns: List of video metadata (title, videoId, thumbnail, url)
     """
-    results = youtube.search_videos(keywords, max_results=10)
+    results = await asyncio.to_thread(youtube.search_videos, keywords, max_results=10)
     return {"videos": results}
 
+# Matches watch?v=, youtu.be/, /shorts/ and /embed/ links
+YOUTUBE_ID_RE = re.compile(r"(?:v=|youtu\.be/|/shorts/|/embed/)([A-Za-z0-9_-]{11})")
+
 @app.post("/add-youtube-video/")
 async def add_youtube_video(link: str = Body(..., embed=True)):
     """
@@ -448,26 +659,43 @@ async def add_youtube_video(link: str = Body(..., embed=True)):
     Expects: {"link": "https://www.youtube.com/watch?v=VIDEO_ID"}
     """
     # Extract video ID from the link
-    match = re.search(r"(?:v=|youtu\.be/)([A-Za-z0-9_-]{11})", link)
+    match = YOUTUBE_ID_RE.search(link)
     if not match:
         raise HTTPException(status_code=400, detail="Invalid YouTube link.")
     video_id = match.group(1)
 
     # Fetch video metadata using YouTube API
-    video_data = youtube.search_videos([video_id], max_results=1)
+    video_data = await asyncio.to_thread(youtube.search_videos, [video_id], max_results=1)
     if not video_data:
         raise HTTPException(status_code=404, detail="Video not found.")
 
     return {"video": video_data[0]}
 
+PDF_CONTENT_TYPES = {"application/pdf", "application/x-pdf"}
+UPLOAD_CHUNK_SIZE = 1 << 16
+
+class ProcessPDFForm(BaseModel):
+    title: str
+    course_id: int
+    auth_token: str
+    prompt: Optional[str] = None
+
+    @classmethod
+    def as_form(
+        cls,
+        title: str = Form(...),
+        course_id: int = Form(...),
+        auth_token: str = Form(...),
+        prompt: Optional[str] = Form(None)
+    ) -> "ProcessPDFForm":
+        # Validated as form fields, so a malformed course_id is a 422 rather than a 500
+        return cls(title=title, course_id=course_id, auth_token=auth_token, prompt=prompt)
+
 @app.post("/process-pdf/")
 async def process_pdf(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    title: str = Form(...),
-    course_id: str = Form(...),
-    auth_token: str = Form(...),
-    prompt: str = Form(None)
+    form: ProcessPDFForm = Depends(ProcessPDFForm.as_form)
 ):
     """
     Upload and process a PDF file to generate a lesson.
@@ -475,23 +703,28 @@ async def process_pdf(
     """
     try:
         # Validate file type
-        if not file.filename.endswith('.pdf'):
+        if not file.filename.endswith('.pdf') or file.content_type not in PDF_CONTENT_TYPES:
+            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+
+        # Sniff the magic bytes before anything touches the disk
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk.startswith(b"%PDF-"):
             raise HTTPException(status_code=400, detail="Only PDF files are allowed")
         
         # Create a unique session ID
-        session_id = f"lesson_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        session_id = f"lesson_{time.time_ns() // 1000}_{secrets.token_hex(3)}"
         
         # Save uploaded file temporarily
-        temp_dir = pathlib.Path("temp")
-        temp_dir.mkdir(exist_ok=True)
-        temp_path = temp_dir / f"{session_id}_{file.filename}"
+        temp_path = TEMP_DIR / f"{session_id}_{file.filename}"
+        track_artifact(session_id, temp_path)
         
-        # Write the uploaded file
-        content = await file.read()
-        with open(temp_path, 'wb') as f:
-            f.write(content)
+        # Stream the uploaded file to disk in chunks
+        async with aiofiles.open(temp_path, 'wb') as f:
+            while chunk:
+                await f.write(chunk)
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
         
-        print(f"✓ PDF uploaded: {file.filename} -> {temp_path}")
+        logger.info("PDF uploaded: %s -> %s", file.filename, temp_path)
         
         # Initialize progress tracker
         progress_tracker[session_id] = {
@@ -504,21 +737,21 @@ async def process_pdf(
         # Combine foundation prompt with user prompt if provided
         foundation_prompt = load_foundation_prompt()
         final_prompt = foundation_prompt
-        if prompt and prompt.strip():
-            final_prompt = f"{foundation_prompt}\n\nAdditional Instructions:\n{prompt}"
+        if form.prompt and form.prompt.strip():
+            final_prompt = f"{foundation_prompt}\n\nAdditional Instructions:\n{form.prompt}"
         
         # Start background task for lesson generation
         background_tasks.add_task(
             generate_lesson_task,
             session_id,
             temp_path,
-            title,
-            int(course_id),
-            auth_token,
+            form.title,
+            form.course_id,
+            form.auth_token,
             final_prompt
         )
         
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "session_id": session_id,
             "message": "PDF processing started",
             "status": "started"
@@ -527,9 +760,7 @@ async def process_pdf(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"✗ Error processing PDF: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error processing PDF")
         raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
 
 @app.get("/lesson-result/{session_id}")
@@ -539,10 +770,10 @@ async def get_lesson_result(session_id: str):
     """
     try:
         # Check if lesson generation is complete
-        if session_id not in progress_tracker:
+        progress_data = progress_tracker.get(session_id)
+        if progress_data is None:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        progress_data = progress_tracker[session_id]
         if progress_data["stage"] != "selection" or progress_data["progress"] < 100:
             raise HTTPException(status_code=202, detail="Lesson generation still in progress")
         
@@ -554,9 +785,9 @@ async def get_lesson_result(session_id: str):
             raise HTTPException(status_code=500, detail="Lesson data not found")
         
         # Clean up progress tracker now that we've retrieved the data
-        del progress_tracker[session_id]
+        progress_tracker.pop(session_id, None)
         
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "lesson_data": lesson_data,
             "youtube_videos": youtube_videos,
             "session_id": session_id
@@ -565,7 +796,7 @@ async def get_lesson_result(session_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error getting lesson result: {e}")
+        logger.exception("Error getting lesson result")
         raise HTTPException(status_code=500, detail=f"Failed to get lesson result: {str(e)}")
 
 # ===== CHATBOT API ENDPOINTS =====
@@ -614,10 +845,10 @@ async def send_chat_message(chat_request: ChatMessage, request: Request):
             auth_token=auth_token
         )
         
-        return JSONResponse(content=result)
+        return ORJSONResponse(content=result)
         
     except Exception as e:
-        print(f"Error in chat endpoint: {e}")
+        logger.exception("Error in chat endpoint")
         raise HTTPException(status_code=500, detail=f"Failed to process chat message: {str(e)}")
 
 @app.get("/api/chat/context/{lesson_id}")
@@ -637,7 +868,7 @@ async def get_chat_context(lesson_id: int, request: Request):
         if not context:
             raise HTTPException(status_code=404, detail="Lesson not found")
         
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "lesson": {
                 "id": lesson_id,
                 "title": context.get("lesson", {}).get("title", ""),
@@ -650,7 +881,7 @@ async def get_chat_context(lesson_id: int, request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error getting chat context: {e}")
+        logger.exception("Error getting chat context")
         raise HTTPException(status_code=500, detail=f"Failed to get chat context: {str(e)}")
 
 @app.get("/api/chat/related-lessons/{lesson_id}")
@@ -665,21 +896,79 @@ async def get_related_lessons(lesson_id: int, request: Request, limit: int = 5):
         if auth_header and auth_header.startswith("Bearer "):
             auth_token = auth_header.split(" ")[1]
         
-        # Get lesson context first to extract keywords
-        context = await chatbot_service.get_lesson_context(lesson_id, auth_token)
-        keywords = context.get("keywords", [])
+        # Keywords are usually known from an earlier context fetch; only fetch the lesson if not
+        keywords = await chatbot_service.get_lesson_keywords(lesson_id, auth_token)
         
         if not keywords:
-            return JSONResponse(content={"related_lessons": []})
+            return ORJSONResponse(content={"related_lessons": []})
         
         related_lessons = await chatbot_service.find_related_lessons(lesson_id, keywords, limit, auth_token)
         
-        return JSONResponse(content={"related_lessons": related_lessons})
+        return ORJSONResponse(content={"related_lessons": related_lessons})
         
     except Exception as e:
-        print(f"Error finding related lessons: {e}")
+        logger.exception("Error finding related lessons")
         raise HTTPException(status_code=500, detail=f"Failed to find related lessons: {str(e)}")
 
+# Outgoing chat frames buffered per connection before the handler waits on the client
+CHAT_QUEUE_SIZE = 256
+
+# Keepalive reply, serialized once; the client only looks at the type
+PONG_FRAME = '{"type":"pong"}'
+
+def _is_token_frame(frame) -> bool:
+    return isinstance(frame, dict) and frame["type"] == "token"
+
+def _merge_token_frames(frames: List[Union[dict, str]]) -> List[Union[dict, str]]:
+    """Collapse runs of consecutive token frames into one frame carrying their joined text"""
+    merged = []
+    for frame in frames:
+        if _is_token_frame(frame) and merged and _is_token_frame(merged[-1]):
+            merged[-1] = {**frame, "content": merged[-1]["content"] + frame["content"]}
+        else:
+            merged.append(frame)
+    return merged
+
+async def _chat_writer(websocket: WebSocket, queue: asyncio.Queue, closed: asyncio.Event):
+    """
+    Send queued chat frames, merging token frames that piled up while the socket was busy.
+    Frames queued as str are already serialized and go out unchanged.
+    """
+    try:
+        while True:
+            frames = [await queue.get()]
+            while not queue.empty():
+                frames.append(queue.get_nowait())
+            for frame in _merge_token_frames(frames):
+                if isinstance(frame, str):
+                    await websocket.send_text(frame)
+                else:
+                    await send_frame(websocket, frame)
+    except Exception as e:
+        logger.debug("Chat WebSocket send failed: %s", e)
+        closed.set()
+        # Keep draining so a handler blocked on a full queue can notice the socket is gone
+        while True:
+            await queue.get()
+
+async def _receive_chat_message(websocket: WebSocket) -> dict:
+    """
+    Read one client frame and parse it as JSON. Binary frames are handed to orjson
+    as-is, skipping the UTF-8 decode a text frame goes through; text frames still work.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    raw = message.get("bytes")
+    if raw is None:
+        raw = message.get("text") or ""
+    return orjson.loads(raw)
+
+# Streamed chat tokens are flushed to the client every TOKEN_BATCH_SIZE tokens or
+# TOKEN_FLUSH_INTERVAL seconds, whichever comes first
+TOKEN_BATCH_SIZE = 16
+TOKEN_FLUSH_INTERVAL = 0.02
+
 @app.websocket("/ws/chat/{session_id}")
 async def websocket_chat_endpoint(websocket: WebSocket, session_id: str, token: Optional[str] = None):
     """
@@ -687,17 +976,28 @@ async def websocket_chat_endpoint(websocket: WebSocket, session_id: str, token:
     Note: Auth token should be passed as query parameter since WebSocket headers are limited.
     """
     await websocket.accept()
-    print(f"Chat WebSocket connected for session: {session_id}")
+    logger.debug("Chat WebSocket connected for session: %s", session_id)
     
     # Store the auth token for this WebSocket session
     auth_token = token
     if not auth_token:
-        print(f"Warning: No auth token provided for WebSocket session {session_id}")
+        logger.warning("No auth token provided for WebSocket session %s", session_id)
+    
+    # Frames go through a bounded queue drained by a writer task, so a slow client
+    # doesn't stall token generation until the queue is full
+    out_queue = asyncio.Queue(maxsize=CHAT_QUEUE_SIZE)
+    send_closed = asyncio.Event()
+    writer = asyncio.create_task(_chat_writer(websocket, out_queue, send_closed))
+
+    async def send(frame: Union[dict, str]):
+        if send_closed.is_set():
+            raise WebSocketDisconnect()
+        await out_queue.put(frame)
     
     try:
         while True:
             # Receive message from client
-            data = await websocket.receive_json()
+            data = await _receive_chat_message(websocket)
             message_type = data.get("type")
             
             if message_type == "message":
@@ -706,7 +1006,7 @@ async def websocket_chat_endpoint(websocket: WebSocket, session_id: str, token:
                 mode = data.get("mode", "default")
                 
                 if not content or not lesson_id:
-                    await websocket.send_json({
+                    await send({
                         "type": "error",
                         "content": "Missing message content or lesson_id"
                     })
@@ -719,7 +1019,7 @@ async def websocket_chat_endpoint(websocket: WebSocket, session_id: str, token:
                 
                 try:
                     # Send typing indicator
-                    await websocket.send_json({
+                    await send({
                         "type": "typing",
                         "content": "AI is thinking...",
                         "timestamp": datetime.now().isoformat()
@@ -742,38 +1042,57 @@ async def websocket_chat_endpoint(websocket: WebSocket, session_id: str, token:
                         prompts = chatbot_service.load_system_prompts()
                         system_prompt = prompts.get(mode, prompts["default"])
                         
-                        llm_context = f"Lesson Content: {lesson_content}\n\n"
-                        recent_history = session.get_recent_history(5)
-                        if recent_history:
-                            llm_context += "Recent conversation:\n"
-                            for msg in recent_history[:-1]:
-                                llm_context += f"{msg['role'].title()}: {msg['content']}\n"
-                            llm_context += "\n"
+                        llm_context = session.build_llm_context(lesson_content)
+                        
+                        # Look up related lessons while the answer streams
+                        keywords = context.get("keywords", [])
+                        related_task = asyncio.create_task(
+                            chatbot_service.find_related_lessons(lesson_id, keywords, 3, auth_token)
+                        )
+                        chatbot_service.begin_generation(session)
+                        try:
+                            # Stream response, sending tokens in small batches rather than one frame each
+                            response_parts = []
+                            loop = asyncio.get_running_loop()
+                            token_batch = []
+                            next_flush = loop.time() + TOKEN_FLUSH_INTERVAL
+                            async for token in llm_service.generate_streaming_response(
+                                prompt=content,
+                                system_prompt=system_prompt,
+                                context=llm_context
+                            ):
+                                response_parts.append(token)
+                                token_batch.append(token)
+                                if len(token_batch) >= TOKEN_BATCH_SIZE or loop.time() >= next_flush:
+                                    await send({
+                                        "type": "token",
+                                        "content": "".join(token_batch),
+                                        "partial": True,
+                                        "timestamp": datetime.now().isoformat()
+                                    })
+                                    token_batch.clear()
+                                    next_flush = loop.time() + TOKEN_FLUSH_INTERVAL
                         
-                        # Stream response
-                        full_response = ""
-                        async for token in llm_service.generate_streaming_response(
-                            prompt=content,
-                            system_prompt=system_prompt,
-                            context=llm_context
-                        ):
-                            full_response += token
-                            await websocket.send_json({
-                                "type": "token",
-                                "content": token,
-                                "partial": True,
-                                "timestamp": datetime.now().isoformat()
-                            })
+                            if token_batch:
+                                await send({
+                                    "type": "token",
+                                    "content": "".join(token_batch),
+                                    "partial": True,
+                                    "timestamp": datetime.now().isoformat()
+                                })
+                        except BaseException:
+                            related_task.cancel()
+                            raise
+                        finally:
+                            chatbot_service.end_generation(session)
                         
-                        # Add complete response to history
-                        session.add_message("assistant", full_response)
+                        full_response = "".join(response_parts)
                         
                         # Send completion signal with suggestions
-                        keywords = context.get("keywords", [])
-                        related_lessons = await chatbot_service.find_related_lessons(lesson_id, keywords, 3, auth_token)
+                        related_lessons = await related_task
                         suggestions = chatbot_service.generate_suggestions(content, full_response, mode)
                         
-                        await websocket.send_json({
+                        await send({
                             "type": "complete",
                             "content": full_response,
                             "related_lessons": related_lessons,
@@ -781,6 +1100,11 @@ async def websocket_chat_endpoint(websocket: WebSocket, session_id: str, token:
                             "timestamp": datetime.now().isoformat()
                         })
                         
+                        # Record the answer once the client has it; the next message on this
+                        # socket isn't read until this turn returns, so history stays in order
+                        session.add_message("assistant", full_response)
+                        chatbot_service.schedule_summary(session)
+                        
                     else:
                         # Fallback to regular response generation
                         result = await chatbot_service.generate_response(
@@ -790,7 +1114,7 @@ async def websocket_chat_endpoint(websocket: WebSocket, session_id: str, token:
                             auth_token=auth_token  # Use the token provided via query parameter
                         )
                         
-                        await websocket.send_json({
+                        await send({
                             "type": "response",
                             "content": result["response"],
                             "related_lessons": result.get("related_lessons", []),
@@ -799,24 +1123,38 @@ async def websocket_chat_endpoint(websocket: WebSocket, session_id: str, token:
                         })
                 
                 except Exception as e:
-                    print(f"❌ Error processing chat message: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    await websocket.send_json({
+                    logger.exception("Error processing chat message for session %s", session_id)
+                    await send({
                         "type": "error",
                         "content": f"Sorry, I encountered an error: {str(e)}. Please try again.",
                         "timestamp": datetime.now().isoformat()
                     })
             
             elif message_type == "ping":
-                await websocket.send_json({"type": "pong", "timestamp": datetime.now().isoformat()})
+                await send(PONG_FRAME)
                 
     except WebSocketDisconnect:
-        print(f"Chat WebSocket disconnected for session: {session_id}")
+        logger.debug("Chat WebSocket disconnected for session: %s", session_id)
     except Exception as e:
-        print(f"Chat WebSocket error for session {session_id}: {e}")
+        logger.warning("Chat WebSocket error for session %s: %s", session_id, e)
     finally:
-        print(f"Chat WebSocket closed for session: {session_id}")
+        writer.cancel()
+        logger.debug("Chat WebSocket closed for session: %s", session_id)
+
+# LLM availability is probed at most once per LLM_HEALTH_TTL seconds; concurrent
+# health checks wait for the probe already in flight instead of starting their own
+LLM_HEALTH_TTL = 5.0
+_llm_health = {"checked_at": float("-inf"), "available": False}
+_llm_health_lock = asyncio.Lock()
+
+async def check_llm_available() -> bool:
+    if time.monotonic() - _llm_health["checked_at"] < LLM_HEALTH_TTL:
+        return _llm_health["available"]
+    async with _llm_health_lock:
+        if time.monotonic() - _llm_health["checked_at"] >= LLM_HEALTH_TTL:
+            _llm_health["available"] = await llm_service.is_available()
+            _llm_health["checked_at"] = time.monotonic()
+    return _llm_health["available"]
 
 @app.get("/api/chat/health")
 async def chat_health_check():
@@ -824,9 +1162,9 @@ async def chat_health_check():
     Health check endpoint for chat functionality.
     """
     try:
-        llm_available = await llm_service.is_available()
+        llm_available = await check_llm_available()
         
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "status": "healthy" if llm_available else "degraded",
             "llm_available": llm_available,
             "timestamp": datetime.now().isoformat(),
@@ -834,7 +1172,7 @@ async def chat_health_check():
         })
         
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             content={
                 "status": "unhealthy",
                 "error": str(e),
@@ -844,23 +1182,30 @@ async def chat_health_check():
         )
 
 @app.post("/api/chat/cleanup")
-async def cleanup_chat_sessions():
+async def cleanup_chat_sessions(sweep: bool = False):
     """
-    Cleanup old chat sessions.
+    Report active chat sessions. Expired sessions are swept in the background;
+    pass sweep=true to run a sweep right away.
     """
     try:
+        if not sweep:
+            return ORJSONResponse(content={
+                "message": "No sweep requested; expired chat sessions are swept in the background",
+                "active_sessions": len(chatbot_service.sessions)
+            })
+
         initial_count = len(chatbot_service.sessions)
-        chatbot_service.cleanup_old_sessions(max_age_hours=24)
+        chatbot_service.cleanup_old_sessions()
         final_count = len(chatbot_service.sessions)
         cleaned = initial_count - final_count
         
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "message": f"Cleaned up {cleaned} expired chat sessions",
             "active_sessions": final_count
         })
         
     except Exception as e:
-        print(f"Error cleaning up chat sessions: {e}")
+        logger.exception("Error cleaning up chat sessions")
         raise HTTPException(status_code=500, detail=f"Failed to cleanup sessions: {str(e)}")
 
 if __name__ == "__main__":
@@ -868,4 +1213,19 @@ if __name__ == "__main__":
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
     reload = os.getenv("ENVIRONMENT", "production") == "development"
-    uvicorn.run("api:app", host=host, port=port, reload=reload)
+    # Lesson progress and websockets are kept in process memory, so more than one worker
+    # needs a load balancer with sticky sessions
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run(
+        "api:app",
+        host=host,
+        port=port,
+        reload=reload,
+        workers=None if reload else workers,
+        # Installed with uvicorn[standard]; uvloop isn't available on Windows
+        loop="uvloop" if find_spec("uvloop") else "asyncio",
+        http="httptools" if find_spec("httptools") else "h11",
+        ws="websockets",
+        # Chat streams many tiny token frames; deflating each one costs more CPU than it saves
+        ws_per_message_deflate=False
+    )
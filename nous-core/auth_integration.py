@@ -4,48 +4,79 @@ This module integrates pi-ai with the pi-frontend authentication system,
 allowing pi-ai to use PayloadCMS auth tokens for API requests.
 """
 
-import sys
+import importlib.util
 import os
 from pathlib import Path
 
-# Add pi-frontend to path
-frontend_path = Path(__file__).parent.parent / "pi-frontend"
-sys.path.insert(0, str(frontend_path))
+# pi-frontend's auth service is loaded from its file on first use, so importing this
+# module neither edits sys.path nor pays for the frontend import up front.
+# PI_FRONTEND_PATH points at the frontend checkout when it isn't next to nous-core
+FRONTEND_PATH = Path(os.getenv("PI_FRONTEND_PATH", Path(__file__).resolve().parent.parent / "frontend"))
+_auth_service = None
 
-try:
-    from services.auth_service import (
-        get_auth_token,
-        authenticate,
-        get_current_user,
-        is_authenticated,
-        logout
-    )
-except ImportError as e:
-    print(f"Error importing auth service: {e}")
-    print("Make sure pi-frontend is set up correctly.")
-    sys.exit(1)
+def _get_auth_service():
+    """Load pi-frontend's auth_service module once and return it"""
+    global _auth_service
+    if _auth_service is None:
+        spec = importlib.util.spec_from_file_location(
+            "pi_frontend_auth_service", FRONTEND_PATH / "services" / "auth_service.py"
+        )
+        module = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(module)
+        except (ImportError, OSError) as e:
+            raise ImportError(
+                f"Error importing auth service: {e}. Make sure the frontend is at {FRONTEND_PATH} or set PI_FRONTEND_PATH."
+            ) from e
+        _auth_service = module
+    return _auth_service
 
 import asyncio
+import threading
+import time
 import httpx
+import orjson
 from typing import Optional, Dict, Any
 
+# How long built auth headers are reused before asking the auth service for the token again
+AUTH_HEADERS_TTL = 60.0
+
 class PIAIAuthIntegration:
     """Authentication integration for PI-AI"""
     
     def __init__(self, payload_url: str = "http://localhost:3000"):
         self.payload_url = payload_url
+        self._client: Optional[httpx.AsyncClient] = None
+        self._headers_cache: Optional[Dict[str, str]] = None
+        self._headers_exp: float = 0.0
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the PayloadCMS client, created on first use and kept for connection reuse"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.payload_url,
+                timeout=10.0,
+                limits=httpx.Limits(max_keepalive_connections=20)
+            )
+        return self._client
+    
+    async def aclose(self) -> None:
+        """Close the PayloadCMS client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     async def ensure_authenticated(self, email: Optional[str] = None, password: Optional[str] = None) -> bool:
         """Ensure pi-ai is authenticated, login if necessary"""
         # Check if already authenticated
-        if await is_authenticated():
+        if await _get_auth_service().is_authenticated():
             print("✅ Already authenticated")
             return True
         
         # Try to authenticate if credentials provided
         if email and password:
             print(f"🔐 Authenticating as {email}...")
-            result = await authenticate(email, password)
+            result = await _get_auth_service().authenticate(email, password)
             if result["success"]:
                 print(f"✅ Authentication successful: {result['user']['email']}")
                 return True
@@ -58,14 +89,25 @@ class PIAIAuthIntegration:
     
     async def get_authenticated_headers(self) -> Optional[Dict[str, str]]:
         """Get headers with authentication token for API requests"""
-        token = await get_auth_token()
+        if self._headers_cache is not None and time.monotonic() < self._headers_exp:
+            return self._headers_cache
+        
+        token = await _get_auth_service().get_auth_token()
         if token:
-            return {
+            self._headers_cache = {
                 "Authorization": f"JWT {token}",
                 "Content-Type": "application/json"
             }
+            self._headers_exp = time.monotonic() + AUTH_HEADERS_TTL
+            return self._headers_cache
+        self._invalidate_headers()
         return None
     
+    def _invalidate_headers(self) -> None:
+        """Forget the cached headers so the next request fetches the token again"""
+        self._headers_cache = None
+        self._headers_exp = 0.0
+    
     async def make_authenticated_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         """Make an authenticated request to PayloadCMS API"""
         headers = await self.get_authenticated_headers()
@@ -78,21 +120,21 @@ class PIAIAuthIntegration:
         else:
             kwargs["headers"] = headers
         
-        url = f"{self.payload_url}/api{endpoint}"
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.request(method, url, **kwargs)
-                
-                if response.status_code == 200:
-                    return {"success": True, "data": response.json()}
-                else:
-                    return {
-                        "success": False, 
-                        "error": f"HTTP {response.status_code}: {response.text}"
-                    }
-            except Exception as e:
-                return {"success": False, "error": f"Request failed: {str(e)}"}
+        try:
+            response = await self._get_client().request(method, f"/api{endpoint}", **kwargs)
+            
+            if response.status_code == 200:
+                # orjson decodes the raw body directly, skipping httpx charset detection
+                return {"success": True, "data": orjson.loads(response.content)}
+            else:
+                if response.status_code == 401:
+                    self._invalidate_headers()
+                return {
+                    "success": False, 
+                    "error": f"HTTP {response.status_code}: {response.text}"
+                }
+        except Exception as e:
+            return {"success": False, "error": f"Request failed: {str(e)}"}
     
     async def get_user_courses(self) -> Dict[str, Any]:
         """Get courses for the current user"""
@@ -112,7 +154,7 @@ class PIAIAuthIntegration:
     
     async def get_current_user_info(self) -> Dict[str, Any]:
         """Get current user information"""
-        result = await get_current_user()
+        result = await _get_auth_service().get_current_user()
         if result["success"]:
             user = result["user"]
             return {
@@ -130,18 +172,24 @@ class PIAIAuthIntegration:
     
     def logout_user(self) -> None:
         """Logout the current user"""
-        logout()
+        _get_auth_service().logout()
+        self._invalidate_headers()
         print("🔓 Logged out successfully")
 
 
 # Convenience functions for easy import
 _auth_integration = None
+# Construction never awaits, so coroutines can't interleave here; the lock covers
+# callers on worker threads so the process still ends up with a single client pool
+_auth_integration_lock = threading.Lock()
 
 def get_auth_integration() -> PIAIAuthIntegration:
     """Get global auth integration instance"""
     global _auth_integration
     if _auth_integration is None:
-        _auth_integration = PIAIAuthIntegration()
+        with _auth_integration_lock:
+            if _auth_integration is None:
+                _auth_integration = PIAIAuthIntegration()
     return _auth_integration
 
 async def ensure_pi_ai_authenticated(email: Optional[str] = None, password: Optional[str] = None) -> bool:
@@ -204,6 +252,8 @@ if __name__ == "__main__":
         else:
             print("⏭️ Skipping authentication test")
         
+        await integration.aclose()
+        
         print("\n✅ Test completed")
     
     asyncio.run(main())
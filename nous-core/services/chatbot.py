@@ -3,18 +3,83 @@ Chatbot Service for PI-LMS
 Handles chat logic, context management, and lesson content integration
 """
 
+import asyncio
 import json
+import re
 import uuid
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+import hashlib
+from collections import Counter, OrderedDict, deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Any
+from datetime import datetime, timedelta
 import aiohttp
 import os
 from dotenv import load_dotenv
 import markdown  # For Markdown to HTML conversion
+from cachetools import TTLCache
 from .llm import get_llm_service
 
 load_dotenv()
 
+# Lesson contexts are shared by every chat session on the same lesson for a few minutes
+CONTEXT_CACHE_TTL = int(os.getenv("CHAT_CONTEXT_TTL", "300"))
+CONTEXT_CACHE_SIZE = 1024
+KEYWORDS_CACHE_TTL = 3600
+# Related lessons are ranked from up to RELATED_CANDIDATES title matches found by Payload,
+# which are cached per lesson and token for RELATED_CACHE_TTL seconds
+RELATED_CANDIDATES = 50
+RELATED_CACHE_TTL = 300
+# Upper bound on live chat sessions; the least recently used one is dropped beyond this
+MAX_CHAT_SESSIONS = int(os.getenv("MAX_CHAT_SESSIONS", "10000"))
+# Sessions idle for longer than this are dropped when next looked up or swept
+SESSION_MAX_AGE_HOURS = 24
+
+# Messages kept per chat session to manage memory
+HISTORY_LIMIT = 20
+# Messages sent verbatim in the LLM context: the current one plus the four before it
+RECENT_HISTORY_MESSAGES = 5
+# Older messages can be folded into a rolling LLM-written summary, SUMMARY_BATCH_SIZE at a time.
+# Off by default: summaries run on the same LLM server as chat answers. Only one runs at a time,
+# and a session's summary is cancelled while that session's next answer is generated
+ENABLE_CHAT_SUMMARIES = os.getenv("ENABLE_CHAT_SUMMARIES", "false").lower() == "true"
+SUMMARY_BATCH_SIZE = 4
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a tutoring conversation about a lesson. "
+    "Fold the new messages into the summary so far, keeping the student's questions, "
+    "the key points explained and anything left unresolved. Reply with the summary only, "
+    "in at most five sentences."
+)
+
+# Keyword candidates are words (letters only, 3+ characters) outside COMMON_WORDS
+KEYWORD_RE = re.compile(r'\b[a-zA-Z]{3,}\b')
+COMMON_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 
+    'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 
+    'has', 'had', 'will', 'would', 'could', 'should', 'may', 'might', 'can'
+})
+
+# Follow-up suggestions offered after each answer (at most three each)
+QUIZ_SUGGESTIONS = (
+    "Can you create another practice question?",
+    "Explain the answer to this question",
+    "What's a common mistake for this topic?"
+)
+EXPLAIN_SUGGESTIONS = (
+    "Can you provide an example?",
+    "How does this relate to other concepts?",
+    "What are the practical applications?"
+)
+SUMMARY_SUGGESTIONS = (
+    "Can you create practice questions?",
+    "What should I focus on studying?",
+    "Are there related lessons?"
+)
+DEFAULT_SUGGESTIONS = (
+    "Can you explain this concept further?",
+    "Create a practice question about this",
+    "What are the key takeaways?"
+)
+
 class ChatSession:
     """Represents a chat session with context and history"""
     
@@ -24,7 +89,17 @@ class ChatSession:
         self.user_id = user_id
         self.created_at = datetime.now()
         self.last_activity = datetime.now()
-        self.history: List[Dict] = []
+        # Only the last HISTORY_LIMIT messages are kept; older ones fall off as new ones arrive
+        self.history: Deque[Dict] = deque(maxlen=HISTORY_LIMIT)
+        # The same messages as they appear in the LLM context, formatted once when added
+        self.formatted_history: Deque[str] = deque(maxlen=HISTORY_LIMIT)
+        # Summary of messages older than the verbatim window, plus those not yet folded into it
+        self.rolling_summary = ""
+        self.unsummarized: List[str] = []
+        self.summarizing = False
+        self.summary_task: Optional[asyncio.Task] = None
+        # Answers being generated for this session; its summary waits until there are none
+        self.generations_in_flight = 0
         self.context_cache = {}
         
     def add_message(self, role: str, content: str, metadata: Optional[Dict] = None):
@@ -36,19 +111,42 @@ class ChatSession:
             "metadata": metadata or {}
         }
         self.history.append(message)
+        self.formatted_history.append(f"{role.title()}: {content}\n")
         self.last_activity = datetime.now()
         
-        # Keep only last 20 messages to manage memory
-        if len(self.history) > 20:
-            self.history = self.history[-20:]
+        # The message that just left the verbatim window is queued for the summary,
+        # keeping at most HISTORY_LIMIT lines while summaries are held back
+        if ENABLE_CHAT_SUMMARIES and len(self.formatted_history) > RECENT_HISTORY_MESSAGES:
+            self.unsummarized.append(self.formatted_history[-RECENT_HISTORY_MESSAGES - 1])
+            del self.unsummarized[:-HISTORY_LIMIT]
     
     def get_recent_history(self, limit: int = 10) -> List[Dict]:
         """Get recent chat history"""
-        return self.history[-limit:] if self.history else []
+        return list(islice(self.history, max(0, len(self.history) - limit), None))
     
     def clear_history(self):
         """Clear chat history"""
-        self.history = []
+        self.history.clear()
+        self.formatted_history.clear()
+        self.rolling_summary = ""
+        self.unsummarized = []
+    
+    def build_llm_context(self, lesson_content: str, history_limit: int = RECENT_HISTORY_MESSAGES) -> str:
+        """Build the LLM context from the lesson content and recent chat history, excluding the current message"""
+        parts = ["Lesson Content: ", lesson_content, "\n\n"]
+        
+        # Older turns are represented by their summary rather than verbatim
+        if self.rolling_summary:
+            parts.extend(("Prior conversation summary: ", self.rolling_summary, "\n\n"))
+        
+        # Add recent chat history for continuity
+        total = len(self.formatted_history)
+        if total and history_limit > 0:
+            parts.append("Recent conversation:\n")
+            parts.extend(islice(self.formatted_history, max(0, total - history_limit), total - 1))
+            parts.append("\n")
+        
+        return "".join(parts)
 
 class ContentIndexer:
     """Handles lesson content processing and indexing for chat context"""
@@ -56,54 +154,51 @@ class ContentIndexer:
     @staticmethod
     def extract_text_from_lexical(lexical_content: Dict) -> str:
         """Extract plain text from Lexical JSON structure"""
-        def extract_from_node(node):
-            text = ""
-            
-            if isinstance(node, dict):
-                # Handle text nodes
-                if node.get("type") == "text":
-                    text += node.get("text", "")
-                
-                # Handle paragraph nodes
-                elif node.get("type") == "paragraph":
-                    children = node.get("children", [])
-                    for child in children:
-                        text += extract_from_node(child)
-                    text += "\n\n"
-                
-                # Handle heading nodes
-                elif node.get("type") == "heading":
-                    children = node.get("children", [])
-                    for child in children:
-                        text += extract_from_node(child)
-                    text += "\n\n"
-                
-                # Handle list nodes
-                elif node.get("type") in ["list", "listitem"]:
-                    children = node.get("children", [])
-                    for child in children:
-                        text += extract_from_node(child)
-                    text += "\n"
-                
-                # Recursively handle other nodes with children
-                elif "children" in node:
-                    children = node.get("children", [])
-                    for child in children:
-                        text += extract_from_node(child)
-            
-            return text
-        
         if not lexical_content:
             return ""
         
         root = lexical_content.get("root", {})
-        children = root.get("children", [])
         
-        full_text = ""
-        for child in children:
-            full_text += extract_from_node(child)
+        # Walk the tree with an explicit stack rather than recursion, so deeply nested
+        # content can't hit the recursion limit. A block's trailing separator is pushed
+        # beneath its children and emitted once they have been walked
+        out = []
+        stack = [child for child in reversed(root.get("children", [])) if isinstance(child, dict)]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                out.append(node)
+                continue
+            
+            node_type = node.get("type")
+            
+            # Handle text nodes
+            if node_type == "text":
+                out.append(node.get("text", ""))
+                continue
+            
+            # Paragraphs and headings end with a blank line, lists and list items with a newline
+            if node_type in ("paragraph", "heading"):
+                stack.append("\n\n")
+            elif node_type in ("list", "listitem"):
+                stack.append("\n")
+            # Other nodes only contribute their children
+            elif "children" not in node:
+                continue
+            
+            stack.extend(child for child in reversed(node.get("children", [])) if isinstance(child, dict))
         
-        return full_text.strip()
+        return "".join(out).strip()
+    
+    @staticmethod
+    def index_content(lexical_content: Dict) -> Dict[str, Any]:
+        """Extract the text, keywords and context summary of a lesson's Lexical content"""
+        text_content = ContentIndexer.extract_text_from_lexical(lexical_content)
+        return {
+            "text_content": text_content,
+            "keywords": ContentIndexer.extract_keywords(text_content),
+            "context_summary": ContentIndexer.create_context_summary(text_content)
+        }
     
     @staticmethod
     def create_context_summary(lesson_content: str, max_length: int = 2000) -> str:
@@ -123,41 +218,62 @@ class ContentIndexer:
     def extract_keywords(lesson_content: str) -> List[str]:
         """Extract key terms from lesson content for semantic search"""
         # Simple keyword extraction (can be enhanced with NLP)
-        import re
-        
-        # Remove common words and extract meaningful terms
-        common_words = {
-            'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 
-            'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 
-            'has', 'had', 'will', 'would', 'could', 'should', 'may', 'might', 'can'
-        }
-        
-        # Extract words (alphanumeric, 3+ characters)
-        words = re.findall(r'\b[a-zA-Z]{3,}\b', lesson_content.lower())
+        words = KEYWORD_RE.findall(lesson_content.lower())
         
-        # Filter out common words and get unique terms
-        keywords = list(set([word for word in words if word not in common_words]))
-        
-        # Return top 20 most frequent keywords
-        word_freq = {}
-        for word in words:
-            if word not in common_words:
-                word_freq[word] = word_freq.get(word, 0) + 1
-        
-        sorted_keywords = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-        return [word for word, freq in sorted_keywords[:20]]
+        # Drop common words, count the remaining terms and return the top 20 most frequent keywords
+        word_freq = Counter(word for word in words if word not in COMMON_WORDS)
+        return [word for word, freq in word_freq.most_common(20)]
 
 class ChatbotService:
     """Main chatbot service handling chat logic and responses"""
     
     def __init__(self):
         self.llm_service = get_llm_service()
-        self.sessions: Dict[str, ChatSession] = {}
+        # Least recently used first, so the oldest session is evicted once the cap is reached
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.max_sessions = MAX_CHAT_SESSIONS
+        self.max_session_age = timedelta(hours=SESSION_MAX_AGE_HOURS)
         self.payload_base_url = os.getenv("PAYLOAD_BASE_URL", "http://localhost:3000")
+        self.lesson_contexts = TTLCache(maxsize=CONTEXT_CACHE_SIZE, ttl=CONTEXT_CACHE_TTL)
+        # Keywords only depend on the lesson, so they outlive the per-token contexts
+        self.lesson_keywords = TTLCache(maxsize=CONTEXT_CACHE_SIZE, ttl=KEYWORDS_CACHE_TTL)
+        self.lesson_candidates = TTLCache(maxsize=CONTEXT_CACHE_SIZE, ttl=RELATED_CACHE_TTL)
+        # Context fetches in flight, by the same key as lesson_contexts
+        self._context_fetches: Dict[tuple, asyncio.Future] = {}
+        # Running summary updates, referenced so they aren't garbage collected mid-flight
+        self._summary_tasks = set()
+        # Summaries queue for a single LLM slot rather than piling up alongside chat answers
+        self._summary_slot = asyncio.Semaphore(1)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._prompts = self.read_system_prompts()
         # Remove dependency on hardcoded token - will use dynamic user tokens only
         print("ChatbotService initialized - will use dynamic user tokens only")
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the Payload CMS session, created on first use so connections are pooled across requests"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self._session
+    
+    async def aclose(self):
+        """Close the Payload CMS session; called on application shutdown"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
         
     def load_system_prompts(self) -> Dict[str, str]:
+        """Get the chatbot system prompts, read from configuration once at startup"""
+        return self._prompts
+    
+    def reload_prompts(self) -> Dict[str, str]:
+        """Re-read the system prompts after config/chatbot_prompts.json has been edited"""
+        self._prompts = self.read_system_prompts()
+        return self._prompts
+    
+    def read_system_prompts(self) -> Dict[str, str]:
         """Load chatbot system prompts from configuration"""
         try:
             with open("config/chatbot_prompts.json", 'r', encoding='utf-8') as f:
@@ -173,6 +289,42 @@ class ChatbotService:
             }
     
     async def get_lesson_context(self, lesson_id: int, auth_token: str = None) -> Dict[str, Any]:
+        """Get lesson context, reusing a recent fetch for the same lesson and token"""
+        if not auth_token:
+            print(f"Error: No auth token provided for lesson context {lesson_id}")
+            return {}
+
+        # Keyed per token so a user never gets a lesson fetched with someone else's access
+        cache_key = (lesson_id, hashlib.sha256(auth_token.encode()).hexdigest())
+        context = self.lesson_contexts.get(cache_key)
+        if context is not None:
+            return context
+
+        # Sessions opening the same lesson at once share one fetch instead of each hitting Payload
+        fetch = self._context_fetches.get(cache_key)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._fetch_and_cache_context(cache_key, lesson_id, auth_token))
+            self._context_fetches[cache_key] = fetch
+            fetch.add_done_callback(lambda _: self._context_fetches.pop(cache_key, None))
+        # Shielded so one caller going away doesn't cancel the fetch for the others
+        return await asyncio.shield(fetch)
+
+    async def _fetch_and_cache_context(self, cache_key: tuple, lesson_id: int, auth_token: str) -> Dict[str, Any]:
+        context = await self.fetch_lesson_context(lesson_id, auth_token)
+        if context:
+            self.lesson_contexts[cache_key] = context
+            self.lesson_keywords[lesson_id] = context.get("keywords", [])
+        return context
+
+    async def get_lesson_keywords(self, lesson_id: int, auth_token: str = None) -> List[str]:
+        """Get a lesson's keywords, only fetching the lesson if they aren't known yet"""
+        keywords = self.lesson_keywords.get(lesson_id)
+        if keywords is None:
+            context = await self.get_lesson_context(lesson_id, auth_token)
+            keywords = context.get("keywords", [])
+        return keywords
+
+    async def fetch_lesson_context(self, lesson_id: int, auth_token: str = None) -> Dict[str, Any]:
         """Fetch lesson content and related information from Payload CMS"""
         try:
             # Require auth token - no fallback to hardcoded token
@@ -185,46 +337,74 @@ class ChatbotService:
                 "Content-Type": "application/json"
             }
             
-            async with aiohttp.ClientSession() as session:
-                # Fetch lesson data
-                async with session.get(
-                    f"{self.payload_base_url}/api/lessons/{lesson_id}",
-                    headers=headers
-                ) as response:
-                    if response.status == 200:
-                        lesson_data = await response.json()
-                        
-                        # Extract text content
-                        content = lesson_data.get("content", {})
-                        text_content = ContentIndexer.extract_text_from_lexical(content)
-                        
-                        # Get course information if available
-                        course_info = {}
-                        course_id = lesson_data.get("course")
-                        if course_id:
-                            async with session.get(
-                                f"{self.payload_base_url}/api/courses/{course_id}",
-                                headers=headers
-                            ) as course_response:
-                                if course_response.status == 200:
-                                    course_info = await course_response.json()
-                        
-                        return {
-                            "lesson": lesson_data,
-                            "text_content": text_content,
-                            "course": course_info,
-                            "keywords": ContentIndexer.extract_keywords(text_content),
-                            "context_summary": ContentIndexer.create_context_summary(text_content)
-                        }
-                    else:
-                        print(f"Failed to fetch lesson {lesson_id}: {response.status}")
-                        if response.status == 403:
-                            print(f"Authentication failed for lesson {lesson_id} - check if auth token is valid")
-                        return {}
+            session = self._get_session()
+            # Fetch lesson data
+            async with session.get(
+                f"{self.payload_base_url}/api/lessons/{lesson_id}",
+                headers=headers
+            ) as response:
+                if response.status != 200:
+                    print(f"Failed to fetch lesson {lesson_id}: {response.status}")
+                    if response.status == 403:
+                        print(f"Authentication failed for lesson {lesson_id} - check if auth token is valid")
+                    return {}
+                lesson_data = await response.json()
+            
+            # Fetch the course while the lesson content is indexed in a worker thread
+            course_info, indexed = await asyncio.gather(
+                self.fetch_course(lesson_data.get("course"), headers),
+                asyncio.to_thread(ContentIndexer.index_content, lesson_data.get("content", {}))
+            )
+            
+            return {
+                "lesson": lesson_data,
+                "course": course_info,
+                **indexed
+            }
         except Exception as e:
             print(f"Error fetching lesson context: {e}")
             return {}
     
+    async def fetch_course(self, course_id, headers: Dict[str, str]) -> Dict[str, Any]:
+        """Fetch course information, or an empty dict if the lesson has no course or the fetch fails"""
+        if not course_id:
+            return {}
+        async with self._get_session().get(
+            f"{self.payload_base_url}/api/courses/{course_id}",
+            headers=headers
+        ) as course_response:
+            if course_response.status == 200:
+                return await course_response.json()
+            return {}
+    
+    async def get_lesson_candidates(self, lesson_id: int, search_terms: List[str], auth_token: str) -> List[Dict]:
+        """
+        Get the lessons whose titles match any of the search terms, letting Payload search the
+        whole collection. Cached per lesson and token; only id and title are kept, which is all
+        the ranking and the chat client use.
+        """
+        cache_key = (lesson_id, hashlib.sha256(auth_token.encode()).hexdigest())
+        candidates = self.lesson_candidates.get(cache_key)
+        if candidates is None:
+            headers = {
+                "Authorization": f"JWT {auth_token}",
+                "Content-Type": "application/json"
+            }
+            params = {"limit": str(RELATED_CANDIDATES), "depth": "0"}
+            for index, term in enumerate(search_terms):
+                params[f"where[or][{index}][title][like]"] = term
+            async with self._get_session().get(
+                f"{self.payload_base_url}/api/lessons",
+                params=params,
+                headers=headers
+            ) as response:
+                if response.status != 200:
+                    return []
+                result = await response.json()
+            candidates = [{"id": doc.get("id"), "title": doc.get("title")} for doc in result.get("docs", [])]
+            self.lesson_candidates[cache_key] = candidates
+        return candidates
+
     async def find_related_lessons(self, lesson_id: int, keywords: List[str], limit: int = 5, auth_token: str = None) -> List[Dict]:
         """Find lessons related to the current one based on keywords"""
         try:
@@ -233,29 +413,22 @@ class ChatbotService:
                 print(f"Error: No auth token provided for related lessons search {lesson_id}")
                 return []
             
-            headers = {
-                "Authorization": f"JWT {auth_token}",
-                "Content-Type": "application/json"
-            }
-            
             # Simple keyword-based search (can be enhanced with semantic search)
-            search_query = " OR ".join(keywords[:5])  # Use top 5 keywords
+            search_terms = [keyword.lower() for keyword in keywords[:5]]  # Use top 5 keywords
+            if not search_terms:
+                return []
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.payload_base_url}/api/lessons?where[title][contains]={search_query}&limit={limit}",
-                    headers=headers
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        lessons = result.get("docs", [])
-                        
-                        # Filter out current lesson
-                        related = [lesson for lesson in lessons if lesson.get("id") != lesson_id]
-                        
-                        return related[:limit]
-                    else:
-                        return []
+            # Lessons matching more of the keywords come first
+            scored = []
+            for lesson in await self.get_lesson_candidates(lesson_id, search_terms, auth_token):
+                # Filter out current lesson
+                if lesson.get("id") == lesson_id:
+                    continue
+                title = (lesson.get("title") or "").lower()
+                scored.append((sum(term in title for term in search_terms), lesson))
+            
+            scored.sort(key=lambda item: item[0], reverse=True)
+            return [lesson for _, lesson in scored[:limit]]
         except Exception as e:
             print(f"Error finding related lessons: {e}")
             return []
@@ -264,11 +437,20 @@ class ChatbotService:
         """Create a new chat session"""
         session_id = str(uuid.uuid4())
         self.sessions[session_id] = ChatSession(session_id, lesson_id, user_id)
+        if len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
         return session_id
     
     def get_session(self, session_id: str) -> Optional[ChatSession]:
-        """Get an existing chat session"""
-        return self.sessions.get(session_id)
+        """Get an existing chat session, or None if it doesn't exist or has been idle too long"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        if datetime.now() - session.last_activity > self.max_session_age:
+            del self.sessions[session_id]
+            return None
+        self.sessions.move_to_end(session_id)
+        return session
     
     async def generate_response(
         self,
@@ -317,15 +499,7 @@ class ChatbotService:
         )
         
         # Build context for LLM
-        llm_context = f"Lesson Content: {lesson_content}\n\n"
-        
-        # Add recent chat history for continuity
-        recent_history = session.get_recent_history(5)
-        if recent_history:
-            llm_context += "Recent conversation:\n"
-            for msg in recent_history[:-1]:  # Exclude the current message
-                llm_context += f"{msg['role'].title()}: {msg['content']}\n"
-            llm_context += "\n"
+        llm_context = session.build_llm_context(lesson_content)
         
         try:
             print(f"🤖 Generating LLM response for message: '{message[:50]}...' in mode: '{mode}'")
@@ -341,15 +515,20 @@ class ChatbotService:
                 raise Exception("LLM service is not available - check Ollama connection and model")
             
             # Generate response using LLM
-            response = await self.llm_service.generate_response(
-                prompt=message,
-                system_prompt=system_prompt,
-                context=llm_context
-            )
+            self.begin_generation(session)
+            try:
+                response = await self.llm_service.generate_response(
+                    prompt=message,
+                    system_prompt=system_prompt,
+                    context=llm_context
+                )
+            finally:
+                self.end_generation(session)
             print(f"✅ LLM response generated successfully: '{response[:100]}...'")
             
             # Add assistant response to history
             session.add_message("assistant", response)
+            self.schedule_summary(session)
             
             # Find related lessons for suggestions
             keywords = context.get("keywords", [])
@@ -385,47 +564,79 @@ class ChatbotService:
                 "format": "html"
             }
     
+    def begin_generation(self, session: ChatSession):
+        """Mark an answer as being generated for a session, cancelling that session's pending summary"""
+        session.generations_in_flight += 1
+        if session.summary_task is not None:
+            session.summary_task.cancel()
+    
+    def end_generation(self, session: ChatSession):
+        """Mark a session's answer as finished"""
+        session.generations_in_flight -= 1
+    
+    def schedule_summary(self, session: ChatSession):
+        """Fold older messages into the session summary in the background once a batch has built up"""
+        if (
+            not ENABLE_CHAT_SUMMARIES
+            or session.generations_in_flight
+            or session.summarizing
+            or len(session.unsummarized) < SUMMARY_BATCH_SIZE
+        ):
+            return
+        session.summarizing = True
+        task = session.summary_task = asyncio.create_task(self.update_rolling_summary(session))
+        self._summary_tasks.add(task)
+        task.add_done_callback(self._summary_tasks.discard)
+    
+    async def update_rolling_summary(self, session: ChatSession):
+        """Ask the LLM to merge the queued messages into the session's rolling summary"""
+        lines, session.unsummarized = session.unsummarized, []
+        try:
+            async with self._summary_slot:
+                summary = await self.llm_service.generate_response(
+                    prompt="New messages:\n" + "".join(lines),
+                    system_prompt=SUMMARY_SYSTEM_PROMPT,
+                    context=f"Summary so far: {session.rolling_summary}" if session.rolling_summary else None
+                )
+            session.rolling_summary = summary.strip()
+        except asyncio.CancelledError:
+            # Preempted by this session's next answer; the lines go back in the queue for a later batch
+            session.unsummarized = (lines + session.unsummarized)[-HISTORY_LIMIT:]
+            raise
+        except Exception as e:
+            print(f"Error summarizing chat history: {e}")
+            # Retry with the next batch, without letting the backlog grow past the history limit
+            session.unsummarized = (lines + session.unsummarized)[-HISTORY_LIMIT:]
+        finally:
+            session.summarizing = False
+            session.summary_task = None
+    
     def generate_suggestions(self, user_message: str, bot_response: str, mode: str) -> List[str]:
         """Generate smart follow-up suggestions based on the conversation"""
-        suggestions = []
-        
         if mode == "quiz_mode":
-            suggestions = [
-                "Can you create another practice question?",
-                "Explain the answer to this question",
-                "What's a common mistake for this topic?"
-            ]
-        elif "explain" in user_message.lower():
-            suggestions = [
-                "Can you provide an example?",
-                "How does this relate to other concepts?",
-                "What are the practical applications?"
-            ]
-        elif "summary" in user_message.lower():
-            suggestions = [
-                "Can you create practice questions?",
-                "What should I focus on studying?",
-                "Are there related lessons?"
-            ]
+            suggestions = QUIZ_SUGGESTIONS
         else:
-            suggestions = [
-                "Can you explain this concept further?",
-                "Create a practice question about this",
-                "What are the key takeaways?",
-                "How can I apply this knowledge?"
-            ]
+            message = user_message.lower()
+            if "explain" in message:
+                suggestions = EXPLAIN_SUGGESTIONS
+            elif "summary" in message:
+                suggestions = SUMMARY_SUGGESTIONS
+            else:
+                suggestions = DEFAULT_SUGGESTIONS
         
-        return suggestions[:3]  # Return top 3 suggestions
+        return list(suggestions)
     
-    def cleanup_old_sessions(self, max_age_hours: int = 24):
+    def cleanup_old_sessions(self, max_age_hours: int = SESSION_MAX_AGE_HOURS):
         """Clean up old inactive sessions"""
         current_time = datetime.now()
         expired_sessions = []
         
+        # Sessions are kept least recently used first, so the scan can stop at the first active one
         for session_id, session in self.sessions.items():
             age = (current_time - session.last_activity).total_seconds() / 3600
-            if age > max_age_hours:
-                expired_sessions.append(session_id)
+            if age <= max_age_hours:
+                break
+            expired_sessions.append(session_id)
         
         for session_id in expired_sessions:
             del self.sessions[session_id]
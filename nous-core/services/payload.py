@@ -2,11 +2,35 @@
 Handles Payload CMS integration for uploading media files.
 """
 
-import requests
+from importlib.util import find_spec
+from typing import Optional
+import httpx
 import os
 import json
 
-def upload_media(file_path: str, media_type: str = "audio", alt: str = None, auth_token: str = None) -> dict:
+# Shared async client so concurrent uploads reuse connections (multiplexed over HTTP/2 when h2 is installed)
+_client: Optional[httpx.AsyncClient] = None
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared Payload CMS client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=find_spec("h2") is not None,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            # Video uploads can take a while; only connecting should fail fast
+            timeout=httpx.Timeout(300.0, connect=5.0)
+        )
+    return _client
+
+async def aclose():
+    """Close the shared client; called on application shutdown"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def upload_media(file_path: str, media_type: str = "audio", alt: str = None, auth_token: str = None) -> dict:
     """
     Uploads a media file (audio/video) to Payload CMS via REST API.
     Always returns the raw media object as returned by Payload CMS (no Lexical node wrapping).
@@ -23,11 +47,11 @@ def upload_media(file_path: str, media_type: str = "audio", alt: str = None, aut
         data = {
             "_payload": json.dumps({"alt": alt})
         }
-        response = requests.post(PAYLOAD_CMS_URL, files=files, data=data, headers=headers)
+        response = await get_client().post(PAYLOAD_CMS_URL, files=files, data=data, headers=headers)
         response.raise_for_status()
         return response.json()
 
-def upload_lesson(lesson_data: dict, auth_token: str = None) -> dict:
+async def upload_lesson(lesson_data: dict, auth_token: str = None) -> dict:
     """
     Uploads the lesson JSON to Payload CMS via REST API.
     Returns the response from Payload CMS (e.g., lesson ID, etc.).
@@ -39,12 +63,12 @@ def upload_lesson(lesson_data: dict, auth_token: str = None) -> dict:
     headers = {"Content-Type": "application/json"}
     if token:
         headers["Authorization"] = f"JWT {token}"
-    
-    response = requests.post(PAYLOAD_CMS_LESSON_URL, headers=headers, json=lesson_data)
+
+    response = await get_client().post(PAYLOAD_CMS_LESSON_URL, headers=headers, json=lesson_data)
     response.raise_for_status()
     return response.json()
 
-def get_lesson_by_id(lesson_id: int, auth_token: str = None) -> dict:
+async def get_lesson_by_id(lesson_id: int, auth_token: str = None) -> dict:
     """
     Retrieves a lesson by its ID from Payload CMS via REST API.
     """
@@ -54,7 +78,7 @@ def get_lesson_by_id(lesson_id: int, auth_token: str = None) -> dict:
     headers = {}
     if token:
         headers["Authorization"] = f"JWT {token}"
-    
-    response = requests.get(PAYLOAD_CMS_LESSON_URL, headers=headers)
+
+    response = await get_client().get(PAYLOAD_CMS_LESSON_URL, headers=headers)
     response.raise_for_status()
     return response.json()
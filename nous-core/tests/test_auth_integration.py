@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import auth_integration
+
+
+@pytest.fixture(autouse=True)
+def reset_auth_service(monkeypatch):
+    monkeypatch.setattr(auth_integration, "_auth_service", None)
+
+
+def test_frontend_path_points_at_frontend():
+    assert (auth_integration.FRONTEND_PATH / "services" / "auth_service.py").is_file()
+
+
+def test_auth_service_resolves():
+    module = auth_integration._get_auth_service()
+    assert callable(module.get_auth_token)
+    assert auth_integration._get_auth_service() is module
+
+
+def test_missing_frontend_raises_import_error(monkeypatch, tmp_path):
+    monkeypatch.setattr(auth_integration, "FRONTEND_PATH", tmp_path)
+    with pytest.raises(ImportError, match="PI_FRONTEND_PATH"):
+        auth_integration._get_auth_service()